@@ -0,0 +1,87 @@
+"""
+透明图标匹配后端对比：MaskedNCC vs cv2.matchTemplate(..., mask=mask)
+
+用法（在项目根目录）：
+    python -m bench.bench_masked_ncc
+
+模板取自 assets 里的图标尺寸，掩码由图标亮度生成（模拟透明背景的 PNG），
+截图为带噪点的 EVE 风格深色背景，并贴入若干图标。
+"""
+import glob
+import os
+import time
+import cv2
+import numpy as np
+
+from core.masked_ncc import MaskedNCC
+
+ASSET_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets")
+REGION_SIZES = [(300, 120), (600, 200), (900, 300)]
+REPEAT = 20
+
+
+def load_masked_icons():
+    icons = []
+    for path in sorted(glob.glob(os.path.join(ASSET_DIR, "*", "*"))):
+        if not path.lower().endswith((".png", ".jpg", ".bmp")):
+            continue
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is None:
+            continue
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        # 亮度较高的部分视为图标本体，其余透明
+        mask = np.where(gray > 40, 255, 0).astype(np.uint8)
+        if np.count_nonzero(mask) == 0:
+            mask[:] = 255
+        icons.append((os.path.basename(path), gray, mask))
+    return icons
+
+
+def make_screen(h, w, icons, rng):
+    screen = (rng.random((h, w)) * 40).astype(np.uint8)
+    screen[rng.random((h, w)) > 0.995] = 200
+    for _, gray, _ in icons:
+        th, tw = gray.shape
+        if th >= h or tw >= w:
+            continue
+        y, x = rng.integers(0, h - th), rng.integers(0, w - tw)
+        screen[y:y + th, x:x + tw] = gray
+    return screen
+
+
+def timeit(fn):
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(REPEAT):
+        fn()
+    return (time.perf_counter() - t0) / REPEAT * 1000
+
+
+def main():
+    rng = np.random.default_rng(0)
+    icons = load_masked_icons()
+    ncc = MaskedNCC()
+
+    print(f"{'region':>10} {'template':>24} {'size':>8} {'corners':>7} {'opencv ms':>10} {'ncc ms':>8} {'speedup':>8} {'max diff':>9}")
+    for h, w in REGION_SIZES:
+        screen = make_screen(h, w, icons, rng)
+        for name, gray, mask in icons:
+            th, tw = gray.shape
+            if th > h or tw > w:
+                continue
+            ms_cv = timeit(lambda: cv2.matchTemplate(screen, gray, cv2.TM_CCOEFF_NORMED, mask=mask))
+            ms_ncc = timeit(lambda: ncc.match(screen, gray, mask))
+
+            ref = cv2.matchTemplate(screen, gray, cv2.TM_CCOEFF_NORMED, mask=mask)
+            res = ncc.match(screen, gray, mask)
+            # OpenCV 在方差为 0 的窗口输出的是浮点噪声，不参与比较
+            valid = np.isfinite(ref) & (res != 0)
+            diff = float(np.abs(ref[valid] - res[valid]).max()) if valid.any() else 0.0
+
+            corners = len(ncc._prepare(gray, mask)[3])
+            print(f"{f'{h}x{w}':>10} {name[:24]:>24} {f'{th}x{tw}':>8} {corners:>7} {ms_cv:>10.2f} "
+                  f"{ms_ncc:>8.2f} {ms_cv / ms_ncc:>7.1f}x {diff:>9.1e}")
+
+
+if __name__ == "__main__":
+    main()
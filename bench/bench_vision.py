@@ -0,0 +1,380 @@
+"""
+视觉引擎基准测试（带回归检查）：
+
+    preprocess/<宽x高>                    VisionEngine.preprocess_image（预分配缓冲）
+    match/<plain|masked>/<宽x高>/n<数量>   VisionEngine.match_templates，不透明 / 透明模板，不同区域和模板库大小
+    match/masked-opencv/...               透明模板走 OpenCV 掩码匹配后端（对照）
+    load_templates/<cold|warm>            VisionEngine.load_templates，无模板缓存 / 模板缓存命中
+    tick/<busy|static>                    完整的 AlarmWorker 监控循环（合成画面，每帧都变 / 画面一直不变）
+
+画面由 assets 里自带的图标合成（core/frame_source.SyntheticSource），每次运行结果可比。
+每项给出 ms/次（多轮取中位数）、次/秒，以及单次调用的临时内存峰值（tracemalloc，KB）。
+
+用法（在项目根目录）：
+    python -m bench.bench_vision                                  # 跑全部，打印表格
+    python -m bench.bench_vision --quick -k match/plain           # 少量用例、按名字过滤
+    python -m bench.bench_vision --save bench/baseline.json       # 保存结果作为基线
+    python -m bench.bench_vision --baseline bench/baseline.json   # 与基线比较，变慢超过容差时退出码为 1
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import cv2
+import numpy as np
+
+from core.vision import VisionEngine
+from core.frame_source import SyntheticSource
+from core.config_manager import ConfigManager
+from core.audio_logic import AlarmWorker
+
+ASSET_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets")
+# (宽, 高)：本地栏、总览、大总览
+REGION_SIZES = [(120, 300), (200, 600), (300, 900)]
+BANK_SIZES = [4, 16, 64]
+QUICK_REGION_SIZES = [(200, 600)]
+QUICK_BANK_SIZES = [16]
+
+# 比较基线时：比基线慢超过这个比例、且绝对差超过 NOISE_MS 才算退化
+DEFAULT_TOLERANCE = 0.15
+NOISE_MS = 0.05
+# 监控循环用例：启动和补足次数各最多等这么久（秒），计时窗口里至少要这么多次结果
+TICK_TIMEOUT = 10
+MIN_TICKS = 3
+
+
+def shipped_icons():
+    icons = []
+    for path in sorted(glob.glob(os.path.join(ASSET_DIR, "*", "*"))):
+        if "sounds" in path or not path.lower().endswith((".png", ".jpg", ".bmp")):
+            continue
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is not None and max(img.shape[:2]) <= 40:
+            icons.append(img)
+    return icons
+
+
+def write_bank(folder, count, masked, icons):
+    """
+    用自带图标生成 count 张互不相同的模板（旋转 / 翻转 / 亮度变化），写入 folder。
+    masked 时按亮度生成 alpha 通道（模拟透明背景的 PNG）
+    """
+    os.makedirs(folder, exist_ok=True)
+    for i in range(count):
+        img = icons[i % len(icons)]
+        variant = i // len(icons)
+        img = np.rot90(img, variant % 4)
+        if variant // 4 % 2:
+            img = img[:, ::-1]
+        img = np.clip(img.astype(np.float32) * (1.0 - 0.08 * (variant // 8)), 0, 255).astype(np.uint8)
+        if masked:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            alpha = np.where(gray > 40, 255, 0).astype(np.uint8)
+            if not alpha.any():
+                alpha[:] = 255
+            img = np.dstack([img, alpha])
+        cv2.imwrite(os.path.join(folder, f"t{i:03d}.png"), img)
+
+
+def measure(fn, min_time=0.3, rounds=5):
+    """多轮计时：每轮至少 min_time / rounds 秒，返回 (中位数 ms, 最小 ms, 每轮次数)"""
+    fn()
+    t0 = time.perf_counter()
+    fn()
+    once = max(time.perf_counter() - t0, 1e-6)
+    n = max(1, int(min_time / rounds / once))
+    per_round = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        per_round.append((time.perf_counter() - t0) / n * 1000)
+    return statistics.median(per_round), min(per_round), n
+
+
+def peak_alloc_kb(fn):
+    """单次调用期间新分配内存的峰值（Python / NumPy 分配，OpenCV 内部临时内存不计）"""
+    fn()
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        fn()
+        return (tracemalloc.get_traced_memory()[1] - base) / 1024
+    finally:
+        tracemalloc.stop()
+
+
+class Fixture:
+    """临时目录：按需生成的模板库、assets 目录结构（load_templates / 监控循环用）和合成画面"""
+
+    def __init__(self):
+        self.dir = tempfile.mkdtemp(prefix="eve_bench_")
+        self.icons = shipped_icons()
+        if not self.icons:
+            raise SystemExit(f"{ASSET_DIR} 里没有可用的图标")
+        self.vision = VisionEngine()
+        self.engines = [self.vision]
+        self._banks = {}
+
+    def close(self):
+        for vision in self.engines:
+            vision.shutdown()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def folder(self, count, masked):
+        folder = os.path.join(self.dir, "banks", f"{'masked' if masked else 'plain'}_{count}")
+        if not os.path.isdir(folder):
+            write_bank(folder, count, masked, self.icons)
+        return folder
+
+    def bank(self, count, masked):
+        key = (count, masked)
+        if key not in self._banks:
+            self._banks[key] = self.vision.load_bank_files(self.folder(count, masked))
+        return self._banks[key]
+
+    def screen(self, size, masked, seed=0):
+        w, h = size
+        source = SyntheticSource({"bank": self.folder(4, masked)}, density=3, seed=seed)
+        return source.grab_regions({"r": (0, 0, w, h)})["r"]
+
+    def assets(self, count):
+        """项目目录结构：assets/ 下三个模板库，load_templates 和监控循环在这个目录下运行"""
+        root = os.path.join(self.dir, f"project_{count}")
+        if not os.path.isdir(root):
+            for name in ("hostile_icons_local", "hostile_icons_overview", "monster_icons"):
+                write_bank(os.path.join(root, "assets", name), count, name != "monster_icons", self.icons)
+        return root
+
+
+def bench_preprocess(fx, sizes):
+    vision = fx.vision
+    for w, h in sizes:
+        gray = cv2.cvtColor(fx.screen((w, h), False), cv2.COLOR_BGRA2GRAY)
+        out, scratch = np.empty_like(gray), np.empty_like(gray)
+        yield f"preprocess/{w}x{h}", lambda: vision.preprocess_image(gray, out, scratch)
+
+
+def bench_match(fx, sizes, bank_sizes):
+    vision = fx.vision
+    for masked, backend in ((False, "ncc"), (True, "ncc"), (True, "opencv")):
+        kind = "masked-opencv" if backend == "opencv" else ("masked" if masked else "plain")
+        for w, h in sizes:
+            img = fx.screen((w, h), masked)
+            # OpenCV 掩码匹配很慢，只测一种模板库大小作对照
+            for count in (bank_sizes[:1] if backend == "opencv" else bank_sizes):
+                bank = fx.bank(count, masked)
+
+                def run(img=img, bank=bank, backend=backend):
+                    vision.masked_backend = backend
+                    # 阈值取 1.01：不会提前结束，每次都是完整匹配；不给 key，不走变化检测和结果缓存
+                    return vision.match_templates(img, bank, 1.01, return_max_val=True)
+                yield f"match/{kind}/{w}x{h}/n{count}", run
+
+
+def bench_load_templates(fx, count):
+    """
+    只计 load_templates 本身：引擎在计时外创建一次（构造时已经加载过一遍模板）。
+    cold 先清空内存里的模板缓存，所有模板重新读图、预处理并写回缓存文件；
+    warm 丢掉内存里的缓存对象，load_templates 从缓存文件重新打开，模板全部命中
+    """
+    root = fx.assets(count)
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        vision = VisionEngine()
+    finally:
+        os.chdir(cwd)
+    fx.engines.append(vision)
+
+    def load(cold):
+        cwd = os.getcwd()
+        os.chdir(root)
+        try:
+            if cold:
+                vision.template_cache.clear()
+            else:
+                vision.template_cache = None
+            vision.load_templates()
+        finally:
+            os.chdir(cwd)
+    yield f"load_templates/cold/n{count}", lambda: load(True)
+    yield f"load_templates/warm/n{count}", lambda: load(False)
+
+
+def run_ticks(fx, change_rate, duration):
+    """
+    完整监控循环：合成画面 + 调度 + 匹配 + 状态行。截图间隔 20ms、CPU 预算放开，测的是最大吞吐
+    （间隔再小的话合成画面本身会占满 CPU，测不出匹配的吞吐）。
+    返回 ({ms: 平均每次匹配的墙钟间隔, ops, latency_ms: 截图到出结果的延迟中位数}, None)；
+    测不出结果时返回 (None, 原因)。一次匹配比 duration 还慢时（单核机器）多等几次，至少 MIN_TICKS 次才算数
+    """
+    root = fx.assets(16)
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        cfg = ConfigManager(os.path.join(root, "bench_config.json"))
+        cfg.config.update({
+            "regions": {"local": [0, 0, 200, 600], "overview": [300, 0, 300, 900], "monster": [700, 0, 300, 120]},
+            "capture_interval": 0.02, "hot_interval": 0.02, "idle_interval": 0.02, "cpu_budget": 1000,
+            "template_hot_reload": False, "webhook_url": "",
+        })
+        source = SyntheticSource({"local": "assets/hostile_icons_local", "overview": "assets/hostile_icons_overview",
+                                  "monster": "assets/monster_icons"},
+                                 density=0.5, change_rate=change_rate, seed=1,
+                                 banks={"local": ["local"], "overview": ["overview"], "monster": ["monster"]})
+        worker = AlarmWorker(cfg, VisionEngine(), source)
+        ticks = []
+        worker.event_signal.connect(lambda e: ticks.append((time.perf_counter(), e.get("latency_ms"))) if "seq" in e else None)
+        worker.start()
+        # 跳过加载模板和启动阶段
+        deadline = time.perf_counter() + TICK_TIMEOUT
+        while len(ticks) < 5 and time.perf_counter() < deadline:
+            time.sleep(0.05)
+        if len(ticks) < 5:
+            worker.stop()
+            return None, f"启动后 {TICK_TIMEOUT:.0f}s 内只出了 {len(ticks)} 次结果"
+        start = len(ticks)
+        time.sleep(duration)
+        deadline = time.perf_counter() + TICK_TIMEOUT
+        while len(ticks) - start < MIN_TICKS and time.perf_counter() < deadline:
+            time.sleep(0.05)
+        worker.stop()
+        window = ticks[start:]
+        if len(window) < MIN_TICKS:
+            return None, f"计时 {duration + TICK_TIMEOUT:.0f}s 内只出了 {len(window)} 次结果（至少要 {MIN_TICKS} 次）"
+        wall = window[-1][0] - window[0][0]
+        ms = wall / (len(window) - 1) * 1000
+        return {"ms": ms, "ms_min": ms, "ops": 1000 / ms, "n": len(window),
+                "latency_ms": statistics.median(l for _, l in window)}, None
+    finally:
+        os.chdir(cwd)
+
+
+def collect(args):
+    sizes = QUICK_REGION_SIZES if args.quick else REGION_SIZES
+    bank_sizes = QUICK_BANK_SIZES if args.quick else BANK_SIZES
+    """跑用例，返回 (结果, 本次应该跑的用例名)；没有结果的用例不在结果里，但在用例名里"""
+    fx = Fixture()
+    results = {}
+    planned = []
+    try:
+        cases = []
+        cases += list(bench_preprocess(fx, sizes))
+        cases += list(bench_match(fx, sizes, bank_sizes))
+        cases += list(bench_load_templates(fx, bank_sizes[-1]))
+        for name, fn in cases:
+            if args.filter and args.filter not in name:
+                continue
+            planned.append(name)
+            ms, ms_min, n = measure(fn, min_time=args.min_time)
+            results[name] = {"ms": ms, "ms_min": ms_min, "ops": 1000 / ms, "n": n, "alloc_kb": peak_alloc_kb(fn)}
+            print_row(name, results[name])
+        for name, change_rate in (("tick/busy", 1.0), ("tick/static", 0.0)):
+            if args.filter and args.filter not in name:
+                continue
+            planned.append(name)
+            row, reason = run_ticks(fx, change_rate, 1.0 if args.quick else 3.0)
+            if row:
+                results[name] = row
+                print_row(name, row)
+            else:
+                print(f"{name:<36} 没有结果: {reason}", flush=True)
+    finally:
+        fx.close()
+    return results, planned
+
+
+def print_row(name, row):
+    text = f"{name:<36} {row['ms']:>9.3f} ms {row['ops']:>9.1f}/s"
+    if "alloc_kb" in row:
+        text += f" {row['alloc_kb']:>9.1f} KB"
+    if "latency_ms" in row:
+        text += f"  延迟 {row['latency_ms']:.1f} ms"
+    print(text, flush=True)
+
+
+def compare(results, baseline, tolerance, excused=()):
+    """
+    和基线比较，返回退化的用例名列表。
+    基线里有、本次没有结果的用例也算退化，除非在 excused 里（被 -k 过滤掉，或 --quick 本来就不跑）
+    """
+    regressions = []
+    print(f"\n{'用例':<36} {'基线 ms':>10} {'本次 ms':>10} {'变化':>8}")
+    for name, row in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<36} {'-':>10} {row['ms']:>10.3f} {'新增':>8}")
+            continue
+        change = row["ms"] / base["ms"] - 1 if base["ms"] else 0.0
+        slower = change > tolerance and row["ms"] - base["ms"] > NOISE_MS
+        mark = "  ← 变慢" if slower else ""
+        print(f"{name:<36} {base['ms']:>10.3f} {row['ms']:>10.3f} {change:>+8.0%}{mark}")
+        if slower:
+            regressions.append(name)
+    for name in baseline:
+        if name in results or name in excused:
+            continue
+        print(f"{name:<36} {baseline[name]['ms']:>10.3f} {'-':>10} {'缺失':>8}  ← 没有结果")
+        regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="视觉引擎基准测试")
+    parser.add_argument("--quick", action="store_true", help="只跑一种区域和模板库大小")
+    parser.add_argument("-k", "--filter", help="只跑名字包含这个字符串的用例")
+    parser.add_argument("--min-time", type=float, default=0.3, help="每个用例至少计时多少秒")
+    parser.add_argument("--save", help="把结果写成 JSON（可作为以后的基线）")
+    parser.add_argument("--baseline", help="与这个 JSON 结果比较")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="允许变慢的比例（默认 0.15）")
+    args = parser.parse_args(argv)
+
+    print(f"{'用例':<36} {'ms/次':>12} {'次/秒':>11} {'内存峰值':>11}")
+    results, planned = collect(args)
+
+    if args.save:
+        report = {
+            "version": 1,
+            "meta": {
+                "time": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "opencv": cv2.__version__,
+                "platform": platform.platform(),
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+                "quick": args.quick,
+            },
+            "results": results,
+        }
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            base_report = json.load(f)
+        baseline = base_report["results"]
+        # -k 过滤掉的用例，以及 --quick 对比完整基线时本来就不跑的用例，不算缺失
+        quick_vs_full = args.quick and not base_report.get("meta", {}).get("quick")
+        excused = {name for name in baseline
+                   if (args.filter and args.filter not in name) or (quick_vs_full and name not in planned)}
+        regressions = compare(results, baseline, args.tolerance, excused)
+        if regressions:
+            print(f"\n{len(regressions)} 项比基线慢超过 {args.tolerance:.0%} 或没有结果: {', '.join(regressions)}")
+            return 1
+        print("\n没有超过容差的退化")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+阈值 / 预处理参数调优（离线，带标注的区域截图）：
+
+数据集目录结构（每个区域一个文件夹，名字是模板库名 local / overview / monster 或额外区域用的模板库文件夹）：
+    dataset/local/hostile/*.png     有敌对图标、必须报警的截图
+    dataset/local/clear/*.png       不应该报警的截图
+    dataset/overview/...
+
+截图可以来自 replay.py --dump-dir 导出的录像画面，手动分到 hostile / clear 里；
+没有真实数据时可以用 --make-synthetic 先生成一份合成数据集试用。
+
+对每一组 预处理参数 × 匹配模式，所有截图只完整匹配一次（记录每帧得分和耗时），
+再用向量化的方式一次算出所有阈值下的精确率 / 召回率。
+pyramid 模式例外：粗匹配的候选峰值取决于传入的阈值（阈值 - COARSE_MARGIN），得分不是与阈值无关的，
+所以按扫描的最低阈值打分（候选最多，得分只会偏高），这条曲线只作参考；推荐阈值下的误报 / 漏报
+按该阈值重新匹配一遍得到，和实际监控时一致。
+推荐：在“召回率 100%（一个敌对都不漏）且精确率不低于 --min-precision”的组合里选最快的，
+阈值取能抓住所有敌对的最高阈值再留一点余量。
+
+用法（在项目根目录）：
+    python -m bench.eval_thresholds dataset/
+    python -m bench.eval_thresholds dataset/ --gamma 1.3,1.5 --cutoff 20,30 --modes standard,pyramid,fft
+    python -m bench.eval_thresholds dataset/ -o report.json
+    python -m bench.eval_thresholds dataset/ --make-synthetic 40
+"""
+import argparse
+import glob
+import itertools
+import json
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+from core.vision import VisionEngine
+from core.frame_source import SyntheticSource, default_icon_folders
+
+POSITIVE, NEGATIVE = "hostile", "clear"
+THRESHOLDS = np.round(np.arange(0.50, 1.0001, 0.005), 3)
+# 推荐阈值比“刚好抓住所有敌对”的阈值再低这么多，给没见过的画面留余量
+MARGIN = 0.01
+# 合成数据集的区域大小 (宽, 高)
+SYNTHETIC_SIZES = {"local": (200, 600), "overview": (300, 600), "monster": (300, 120)}
+
+
+def load_dataset(root):
+    """{区域: (图片列表, 标签数组 bool)}"""
+    dataset = {}
+    for region in sorted(os.listdir(root)):
+        images, labels = [], []
+        for label, positive in ((POSITIVE, True), (NEGATIVE, False)):
+            for path in sorted(glob.glob(os.path.join(root, region, label, "*"))):
+                img = cv2.imread(path, cv2.IMREAD_COLOR) if path.lower().endswith(('.png', '.jpg', '.bmp')) else None
+                if img is not None:
+                    images.append(img)
+                    labels.append(positive)
+        if images:
+            dataset[region] = (images, np.array(labels, bool))
+    return dataset
+
+
+def make_synthetic(root, count, seed=0):
+    """按自带模板生成合成数据集：每个内置区域 count 张有图标的截图和 count 张空截图"""
+    folders = default_icon_folders()
+    for region, (w, h) in SYNTHETIC_SIZES.items():
+        if not SyntheticSource({region: folders[region]}).icons[region]:
+            # 没有图标就生成不出有敌对的截图，跳过这个区域
+            print(f"{folders[region]} 里没有图标，跳过 {region}", file=sys.stderr)
+            continue
+        for label, density in ((POSITIVE, 1.5), (NEGATIVE, 0.0)):
+            folder = os.path.join(root, region, label)
+            os.makedirs(folder, exist_ok=True)
+            source = SyntheticSource({region: folders[region]}, density=density, seed=seed)
+            saved = 0
+            while saved < count:
+                img = source.grab_regions({region: (0, 0, w, h)})[region]
+                # 有图标的截图必须真的贴进了图标（泊松分布可能抽到 0 个）
+                if label == POSITIVE and not source.last_truth[region]:
+                    continue
+                cv2.imwrite(os.path.join(folder, f"{saved:04d}.png"), img[:, :, :3])
+                saved += 1
+
+
+def score_frames(vision, images, bank, mode, preprocess, threshold=1.01):
+    """
+    完整匹配每一张截图（不提前结束、不复用），返回 (每帧得分, 平均 ms/帧)
+    threshold 只影响 pyramid 模式的候选峰值，其他模式的得分与它无关
+    """
+    scores = np.empty(len(images), np.float32)
+    elapsed = 0.0
+    for i, img in enumerate(images):
+        t0 = time.perf_counter()
+        err, score = vision.match_templates(img, bank, threshold, return_max_val=True, mode=mode, preprocess=preprocess)
+        elapsed += time.perf_counter() - t0
+        scores[i] = score if not err else 0.0
+    return scores, elapsed / len(images) * 1000
+
+
+def sweep(scores, labels, thresholds=THRESHOLDS):
+    """所有阈值一次算完：返回 {threshold, tp, fp, fn, precision, recall} 各为数组"""
+    predicted = scores[None, :] >= thresholds[:, None]
+    tp = (predicted & labels).sum(axis=1)
+    fp = (predicted & ~labels).sum(axis=1)
+    fn = labels.sum() - tp
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 1.0)
+        recall = np.where(labels.sum() > 0, tp / max(labels.sum(), 1), 1.0)
+    return {"threshold": thresholds, "tp": tp, "fp": fp, "fn": fn, "precision": precision, "recall": recall}
+
+
+def summarize(scores, labels):
+    """能抓住所有敌对的最高阈值（减去余量）以及那个阈值下的误报情况"""
+    pos, neg = scores[labels], scores[~labels]
+    lowest_hostile = float(pos.min()) if len(pos) else 1.0
+    highest_clear = float(neg.max()) if len(neg) else 0.0
+    threshold = round(max(lowest_hostile - MARGIN, 0.0), 3)
+    return {
+        "threshold": threshold,
+        **decide(scores, labels, threshold),
+        # 敌对最低分与空画面最高分之差，越大越稳
+        "separation": lowest_hostile - highest_clear,
+    }
+
+
+def decide(scores, labels, threshold):
+    """某个阈值下的精确率、误报数和漏报数"""
+    hit = scores >= threshold
+    tp = int((hit & labels).sum())
+    fp = int((hit & ~labels).sum())
+    return {"precision": tp / (tp + fp) if tp + fp else 1.0, "false_alarms": fp, "missed": int(labels.sum()) - tp}
+
+
+def parse_list(text, cast):
+    return [cast(v) for v in text.split(",") if v.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="阈值 / 预处理参数调优")
+    parser.add_argument("dataset", help="带标注的截图目录（见文件开头的说明）")
+    parser.add_argument("--gamma", default="1.3,1.5,1.8", help="要试的 gamma，逗号分隔")
+    parser.add_argument("--cutoff", default="20,30,40", help="要试的暗部截断值")
+    parser.add_argument("--clahe", default="1.5", help="要试的 CLAHE clipLimit")
+    parser.add_argument("--modes", default="standard,pyramid", help="要试的匹配模式（standard / pyramid / fft）")
+    parser.add_argument("--min-precision", type=float, default=0.9, help="推荐组合要求的最低精确率")
+    parser.add_argument("-o", "--output", help="把所有组合的完整结果（含每个阈值的精确率 / 召回率）写成 JSON")
+    parser.add_argument("--make-synthetic", type=int, metavar="N", help="先在 dataset 目录生成合成数据集（每类 N 张）")
+    args = parser.parse_args(argv)
+
+    if args.make_synthetic:
+        make_synthetic(args.dataset, args.make_synthetic)
+    dataset = load_dataset(args.dataset)
+    if not dataset:
+        print(f"{args.dataset} 里没有找到 <区域>/{POSITIVE}|{NEGATIVE}/*.png", file=sys.stderr)
+        return 2
+
+    vision = VisionEngine()
+    vision.load_templates()
+    grid = list(itertools.product(parse_list(args.gamma, float), parse_list(args.cutoff, int),
+                                  parse_list(args.clahe, float), parse_list(args.modes, str)))
+    report = {}
+    for region, (images, labels) in dataset.items():
+        print(f"\n== {region}: {int(labels.sum())} 张敌对 / {int((~labels).sum())} 张空画面，{len(grid)} 组参数 ==")
+        print(f"{'gamma':>6} {'cutoff':>6} {'clahe':>6} {'mode':>9} {'ms/帧':>8} {'阈值':>7} {'精确率':>7} {'误报':>5} {'间隔':>7}")
+        rows = []
+        for gamma, cutoff, clip, mode in grid:
+            preprocess = {"gamma": gamma, "cutoff": cutoff, "clahe_clip": clip}
+            bank = vision.get_bank(region, preprocess)
+            # pyramid 的得分取决于阈值：按最低阈值打分，推荐阈值再单独复核
+            exact = mode != "pyramid"
+            scores, ms = score_frames(vision, images, bank, mode, preprocess,
+                                      1.01 if exact else float(THRESHOLDS.min()))
+            curve = sweep(scores, labels)
+            best = summarize(scores, labels)
+            if not exact:
+                rescored, _ = score_frames(vision, images, bank, mode, preprocess, best["threshold"])
+                best.update(decide(rescored, labels, best["threshold"]))
+            rows.append({"gamma": gamma, "cutoff": cutoff, "clahe_clip": clip, "mode": mode, "ms": ms, **best,
+                         "curve_exact": exact, "curve": {k: v.tolist() for k, v in curve.items()}})
+            note = "" if exact else f"  曲线按阈值 {THRESHOLDS.min():.2f} 打分，仅供参考" + (
+                f"；复核漏报 {best['missed']}" if best["missed"] else "")
+            print(f"{gamma:>6.2f} {cutoff:>6d} {clip:>6.2f} {mode:>9} {ms:>8.2f} {best['threshold']:>7.3f} "
+                  f"{best['precision']:>7.1%} {best['false_alarms']:>5d} {best['separation']:>+7.3f}{note}")
+
+        ok = [r for r in rows if r["precision"] >= args.min_precision and not r["missed"]]
+        if ok:
+            pick = min(ok, key=lambda r: (r["ms"], -r["separation"]))
+            print(f"推荐：gamma {pick['gamma']} cutoff {pick['cutoff']} clahe {pick['clahe_clip']} 模式 {pick['mode']}，"
+                  f"阈值 {pick['threshold']:.3f}（{pick['ms']:.2f} ms/帧，精确率 {pick['precision']:.1%}）")
+        else:
+            best = max(rows, key=lambda r: r["precision"])
+            print(f"没有组合在不漏报的前提下达到 {args.min_precision:.0%} 精确率；"
+                  f"最好的是 gamma {best['gamma']} cutoff {best['cutoff']} 模式 {best['mode']}（精确率 {best['precision']:.1%}）")
+            pick = None
+        report[region] = {"configs": rows, "recommended": {k: v for k, v in pick.items() if k != "curve"} if pick else None}
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    vision.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,37 +1,207 @@
 import time
 import threading
 import requests
+from collections import deque
 from datetime import datetime
-from PyQt6.QtCore import QObject, pyqtSignal
+from core.signals import Signal
+from core.frame_queue import Frame, FrameQueue
+from core.process_pool import ProcessMatchPool
+from core.regions import load_regions, choose_sound
+from core.template_watch import TemplateWatcher
+from core.scheduler import TickScheduler
+from core.recorder import SessionRecorder
+from core.metrics import metrics, MetricsServer, MetricsDumper
 
-class AlarmWorker(QObject):
-    log_signal = pyqtSignal(str)
+def vision_settings(cfg):
+    """配置里的引擎级匹配参数；本进程的 VisionEngine 和匹配子进程用同一份"""
+    cache_size = cfg.get("result_cache_size")
+    return {
+        "change_detection": bool(cfg.get("change_detection")),
+        "masked_backend": cfg.get("masked_backend") or "ncc",
+        "match_threads": cfg.get("match_threads") or 1,
+        "result_cache_size": 64 if cache_size is None else int(cache_size),
+    }
 
-    def __init__(self, config_manager, vision_engine):
-        super().__init__()
+
+def apply_vision_settings(cfg, vision):
+    """把配置里的全局匹配参数应用到 VisionEngine（每次匹配前调用，配置修改立即生效）"""
+    vision.apply_settings(vision_settings(cfg))
+
+
+def match_options(cfg, region):
+    """区域的匹配参数：区域自己的设置优先，其次是按区域 key、再按模板库名的全局设置"""
+    def pick(name, default):
+        table = cfg.get(name) or {}
+        return table.get(region.key, table.get(region.bank, default))
+    opts = {"mode": pick("match_modes", "standard"), "early_exit": bool(cfg.get("early_exit")),
+            "track_roi": bool(cfg.get("roi_tracking")), "list_layout": pick("list_layouts", None),
+            "color_gate": bool(pick("color_gates", False)), "preprocess": pick("preprocess", None) or None}
+    opts.update(region.options)
+    return opts
+
+
+class AlarmWorker:
+    """
+    监控主循环，不依赖 Qt（无界面模式也用它）。
+    log_signal 发出给人看的日志行，event_signal 发出结构化事件（dict）；
+    两个信号都在监控线程里发出，界面需要自己转发到主线程。
+    """
+
+    def __init__(self, config_manager, vision_engine, source=None):
+        self.log_signal = Signal()
+        self.event_signal = Signal()
         self.cfg = config_manager
         self.vision = vision_engine
+        # 画面来源（实时截图 / 录像 / 合成画面 / 共享内存），None 表示沿用 vision 当前的来源
+        if source is not None:
+            self.vision.set_source(source)
         self.running = False
         self.thread = None
-        self.status = {"local": False, "overview": False, "monster": False}
+        self.capture_thread = None
+        # 区域 key -> 是否命中
+        self.status = {}
         self.first_run = True 
 
+        # 截图线程 -> 匹配线程的帧队列；每次判定记录从截图到出结果的延迟（毫秒）
+        self.frames = FrameQueue(maxsize=2)
+        self.latency_ms = deque(maxlen=100)
+
+        # 多进程匹配后端（vision_processes > 0 时启用）；子进程异常退出的次数
+        self.pool = None
+        self.pool_failures = 0
+        # 模板文件夹热更新
+        self.watcher = TemplateWatcher(vision_engine)
+
+        # 自适应调度：每个区域按自己的节奏截图；没到期的区域沿用上一次的结果
+        self.scheduler = TickScheduler()
+        self.results = {}
+        self._last_webhook = {}
+
+        # 会话录像（record_sessions 打开时每次启动监控新建一个文件）
+        self.recorder = None
+
+        # 分阶段耗时统计（metrics_enabled），可通过 self.metrics.snapshot()、本机接口或定期写文件查看
+        self.metrics = metrics
+        self.metrics_server = None
+        self.metrics_dumper = None
+
     def start(self):
         if not self.running:
             self.running = True
             self.first_run = True 
-            self.thread = threading.Thread(target=self._loop, daemon=True)
+            self.pool_failures = 0
+            self.frames.clear()
+            self.results = {}
+            self.scheduler = TickScheduler()
+            if self.cfg.get("record_sessions"):
+                self.recorder = SessionRecorder.for_session(
+                    self.cfg.get("record_folder") or "recordings",
+                    keyframe_interval=self.cfg.get("record_keyframe_interval") or 120)
+                self.recorder.start_session({
+                    "started": datetime.now().isoformat(timespec="seconds"),
+                    "regions": [{"key": r.key, "rect": r.rect, "bank": r.bank, "threshold": r.threshold,
+                                 "client": r.client} for r in load_regions(self.cfg)],
+                })
+            self._start_metrics()
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
             self.thread.start()
+            self.capture_thread.start()
 
     def stop(self):
         self.running = False
+        if self.capture_thread:
+            self.capture_thread.join()
         if self.thread:
             self.thread.join()
+        self.vision.shutdown()
+        if self.pool:
+            self.pool.close()
+            self.pool = None
+        self.watcher.stop()
+        self._stop_metrics()
+        if self.recorder:
+            recorder, self.recorder = self.recorder, None
+            recorder.close()
+            self.log_signal.emit(f"录像已保存: {recorder.path}（{recorder.frames} 帧, "
+                                 f"{recorder.bytes_written / 1048576:.1f}MB）")
+
+    def _start_metrics(self):
+        self.metrics.configure(self.cfg.get("metrics_enabled"), self.cfg.get("metrics_window"))
+        if not self.metrics.enabled:
+            return
+        port = self.cfg.get("metrics_port")
+        if port and self.metrics_server is None:
+            try:
+                self.metrics_server = MetricsServer(self.metrics, int(port))
+                self.log_signal.emit(f"耗时统计接口: http://127.0.0.1:{self.metrics_server.port}/metrics")
+            except OSError as e:
+                self.log_signal.emit(f"耗时统计接口启动失败: {e}")
+        path = self.cfg.get("metrics_file")
+        if path and self.metrics_dumper is None:
+            self.metrics_dumper = MetricsDumper(self.metrics, path, self.cfg.get("metrics_interval") or 10.0)
+
+    def _stop_metrics(self):
+        if self.metrics_server:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        if self.metrics_dumper:
+            self.metrics_dumper.stop()
+            self.metrics_dumper = None
+
+    # 匹配子进程异常退出后最多重启几次，超过后一直在本进程内匹配
+    POOL_MAX_RESTARTS = 3
+
+    def _pool_failed(self, error):
+        """子进程异常退出（管道断开）：关掉进程池，记日志；重启次数用完后退回本进程匹配"""
+        try:
+            self.pool.close()
+        except OSError:
+            pass
+        self.pool = None
+        self.pool_failures += 1
+        fallback = self.pool_failures > self.POOL_MAX_RESTARTS
+        action = "改为在本进程内匹配" if fallback else "下一帧重启匹配子进程"
+        self.log_signal.emit(f"[{datetime.now().strftime('%H:%M:%S')}] ❌ 匹配子进程异常退出"
+                             f"（{type(error).__name__}: {error}），{action}")
+        self.event_signal.emit({"event": "pool_error", "time": datetime.now().isoformat(timespec="seconds"),
+                                "error": f"{type(error).__name__}: {error}", "failures": self.pool_failures,
+                                "fallback": fallback})
 
-    def _loop(self):
+    def _schedule_settings(self):
+        return {
+            "interval": self.cfg.get("capture_interval"),
+            "hot_interval": self.cfg.get("hot_interval"),
+            "idle_interval": self.cfg.get("idle_interval"),
+            "idle_after": self.cfg.get("idle_after"),
+            "hot_hold": self.cfg.get("hot_hold"),
+            "cpu_budget": self.cfg.get("cpu_budget"),
+        }
+
+    def _capture_loop(self):
+        """截图线程：按调度器给出的到期时间截图，带时间戳放入帧队列"""
+        seq = 0
+        try:
+            while self.running:
+                regions = load_regions(self.cfg)
+                self.scheduler.configure(regions, self._schedule_settings())
+                timestamp = time.perf_counter()
+                due = self.scheduler.due(timestamp)
+                if due:
+                    # 截图：到期的区域合并为一次截图，保证来自同一帧
+                    with self.metrics.timer("capture"):
+                        images = self.vision.capture_regions({r.key: r.rect for r in regions if r.key in due})
+                    self.frames.put(Frame(seq, timestamp, images))
+                    seq += 1
+
+                # 睡到最近的到期时间（最多 0.5 秒，以便及时响应停止和配置变化）
+                time.sleep(min(0.5, max(0.001, self.scheduler.next_wake() - time.perf_counter())))
+        finally:
+            # 截图会话绑定在本线程上，退出时释放
+            self.vision.capture.close()
+
+    def _run(self):
         while self.running:
-            now_str = datetime.now().strftime("%H:%M:%S")
-            
             if self.first_run:
                 self.vision.load_templates()
                 report = (
@@ -40,66 +210,193 @@ class AlarmWorker(QObject):
                     f"--------------------"
                 )
                 self.log_signal.emit(report)
+                self.event_signal.emit({"event": "startup", "time": datetime.now().isoformat(timespec="seconds"),
+                                        "templates": {name: len(bank) for name, bank in self.vision.banks.items()},
+                                        "message": self.vision.template_status_msg})
                 self.first_run = False
+                if self.cfg.get("template_hot_reload"):
+                    self.watcher.start()
                 time.sleep(1)
 
-            regions = self.cfg.get("regions")
-            thresholds = self.cfg.get("thresholds")
-            t_local = thresholds.get("local", 0.95)
-            t_overview = thresholds.get("overview", 0.95)
-            t_monster = thresholds.get("monster", 0.95)
+            # 两次匹配之间换上热更新后的模板库
+            changes = self.watcher.apply()
+            if changes:
+                desc = ", ".join(f"{name} {old}->{new} 张" for name, (old, new) in changes.items())
+                self.log_signal.emit(f"[{datetime.now().strftime('%H:%M:%S')}] 🔄 模板已更新: {desc}")
+                self.event_signal.emit({"event": "reload", "time": datetime.now().isoformat(timespec="seconds"),
+                                        "changes": {name: list(counts) for name, counts in changes.items()}})
+                if self.pool:
+                    try:
+                        self.pool.reload()
+                    except (EOFError, OSError) as e:
+                        self._pool_failed(e)
+
+            # 子进程启动较慢，要在取帧之前完成，否则第一帧的延迟会包含启动时间
+            processes = self.cfg.get("vision_processes") or 0
+            if processes and self.pool is None and self.pool_failures <= self.POOL_MAX_RESTARTS:
+                try:
+                    self.pool = ProcessMatchPool(processes)
+                except (EOFError, OSError) as e:
+                    self._pool_failed(e)
+
+            # 取最新的未过期帧（更早的帧跳过，其中的区域图像合并进来）；匹配期间截图线程已经在截下一帧
+            frame = self.frames.get(timeout=1.0, max_age=self.cfg.get("max_frame_age") or 1.0)
+            if frame is None:
+                continue
+            t_tick = time.perf_counter()
+            # 从截图完成到开始匹配，在队列里等了多久
+            self.metrics.record("queue", frame.age() * 1000)
+            wall = datetime.now()
+            now_str = wall.strftime("%H:%M:%S")
 
-            # 截图
-            img_local = self.vision.capture_screen(regions.get("local"), "local")
-            img_overview = self.vision.capture_screen(regions.get("overview"), "overview")
-            img_monster = self.vision.capture_screen(regions.get("monster"), "monster")
+            regions = load_regions(self.cfg)
 
-            def process_match(img, templates, thresh):
-                err_msg, score = self.vision.match_templates(img, templates, thresh, True)
-                is_hit = score >= thresh
-                return is_hit, score, err_msg
+            apply_vision_settings(self.cfg, self.vision)
+            early_exit = bool(self.cfg.get("early_exit"))
+            track_roi = bool(self.cfg.get("roi_tracking"))
+            region_options = {r.key: match_options(self.cfg, r) for r in regions}
+            # 只匹配这一帧里截到的（到期的）区域
+            active = [r for r in regions if r.key in frame.images]
+            t_match = time.perf_counter()
 
             # === 修改点：使用各自独立的图标库 ===
-            # Local 截图 -> 匹配 local_templates
-            is_local, score_local, err_local = process_match(img_local, self.vision.local_templates, t_local)
-            
-            # Overview 截图 -> 匹配 overview_templates
-            is_overview, score_overview, err_overview = process_match(img_overview, self.vision.overview_templates, t_overview)
-            
-            # Monster 截图 -> 匹配 monster_templates
-            is_monster, score_monster, err_monster = process_match(img_monster, self.vision.monster_templates, t_monster)
-
-            self.status["local"] = is_local
-            self.status["overview"] = is_overview
-            self.status["monster"] = is_monster
-
-            # 报警逻辑
-            has_threat = is_local or is_overview
-            sound_to_play = None
-            if has_threat and is_monster: sound_to_play = "mixed"
-            elif is_overview: sound_to_play = "overview"
-            elif is_local: sound_to_play = "local"
-            elif is_monster: sound_to_play = "monster"
-
-            def fmt(score, err):
+            # 所有区域并行匹配，每个区域用自己的模板库
+            results = None
+            if self.pool:
+                try:
+                    results = self.pool.match_regions(
+                        {r.key: (frame.images.get(r.key), r.bank, r.threshold, region_options[r.key]) for r in active},
+                        vision_settings(self.cfg))
+                except (EOFError, OSError) as e:
+                    # 子进程挂了：这一帧改在本进程内匹配，下一帧重启子进程
+                    self._pool_failed(e)
+            if results is None:
+                results = self.vision.match_regions(
+                    {r.key: (frame.images.get(r.key), self.vision.get_bank(r.bank, region_options[r.key]["preprocess"]), r.threshold, region_options[r.key])
+                     for r in active})
+            now = time.perf_counter()
+            self.scheduler.tick_done(now - t_match, now)
+            self.results.update(results)
+            if self.metrics.enabled:
+                self.metrics.record("match", (now - t_match) * 1000)
+                if not self.pool:
+                    for r in active:
+                        stages = self.vision.stage_ms.get(r.key, {})
+                        self.metrics.record(f"preprocess/{r.key}", stages.get("gray", 0) + stages.get("preprocess", 0))
+                        self.metrics.record(f"match/{r.bank}", stages.get("match", 0))
+
+            for r in active:
+                unchanged = self.vision.last_match_mode.get(r.key) in ("reuse", "cached") and not self.pool
+                self.scheduler.report(r.key, results[r.key][1] >= r.threshold, unchanged, now)
+
+            t_decision = time.perf_counter()
+            # 还没截到过的区域不参与判定和显示
+            regions = [r for r in regions if r.key in self.results]
+            hits = []
+            for r in regions:
+                is_hit = self.results[r.key][1] >= r.threshold
+                self.status[r.key] = is_hit
+                if is_hit:
+                    hits.append(r)
+
+            # 报警逻辑：混合威胁 > 优先级最高的命中区域
+            sound_to_play = choose_sound(hits)
+            if self.recorder:
+                self.recorder.record(frame, results, sound_to_play)
+
+            latency = frame.age() * 1000
+            self.latency_ms.append(latency)
+            t_status = time.perf_counter()
+            self.metrics.record("decision", (t_status - t_decision) * 1000)
+
+            mode_names = {"reuse": "复用", "cached": "缓存", "partial": "局部", "roi": "追踪", "gated": "筛选", "full": "重算"}
+
+            def fmt(score, err, region):
                 if err: return f"❌{err}"
-                return f"{score:.2f}"
+                key = region.key
+                opts = region_options[key]
+                text = f"{score:.2f}"
+                if self.vision.change_detection or track_roi or opts["color_gate"]:
+                    mode = mode_names.get(self.vision.last_match_mode.get(key))
+                    if mode: text += f" {mode}"
+                if early_exit and score >= region.threshold:
+                    evaluated, total = self.vision.last_evaluated.get(key, (0, 0))
+                    if 0 < evaluated < total: text += f" 早停{evaluated}/{total}"
+                if opts["color_gate"] and self.vision.last_match_mode.get(key) == "gated":
+                    count = self.vision.last_candidates.get(key)
+                    text += f" 候选{count}" if count else " 无候选"
+                if opts["mode"] == "list":
+                    rows = self.vision.last_row_hits.get(key)
+                    text += f" 敌对{rows}行" if rows is not None else " 列表校准中"
+                if opts["mode"] == "pyramid":
+                    stats = self.vision.pyramid.stats.get(key, {})
+                    speedup = stats.get("speedup")
+                    text += f" 金字塔x{speedup:.1f}" if speedup else " 金字塔"
+                    # 和全分辨率匹配对比时阈值判定不一致的次数（粗匹配漏掉了峰值）
+                    if stats.get("disagree"):
+                        text += f" 不一致{stats['disagree']}/{stats['checks']}"
+                return text
+
+            # 按客户端分组显示，主客户端不加前缀
+            groups = {}
+            for r in regions:
+                err, score = self.results[r.key]
+                groups.setdefault(r.client, []).append(f"{r.label}:{int(self.status[r.key])}({fmt(score, err, r)})")
+            status_desc = " ".join((f"{client}" if client != "main" else "") + "[" + " | ".join(parts) + "]"
+                                   for client, parts in groups.items())
+            if self.vision.change_detection and not self.pool:
+                status_desc += f" 复用率 {self.vision.reuse_ratio():.0%}"
+            cache = self.vision.result_cache
+            if cache.size > 0 and not self.pool:
+                status_desc += f" 缓存 {cache.hits}/{cache.hits + cache.misses}"
+            if not self.pool:
+                # 各区域各阶段耗时之和，看预处理和匹配各占多少
+                stage_ms = [self.vision.stage_ms.get(r.key, {}) for r in regions]
+                status_desc += (f" 预处理 {sum(s.get('gray', 0) + s.get('preprocess', 0) for s in stage_ms):.1f}ms"
+                                f" 匹配 {sum(s.get('match', 0) for s in stage_ms):.1f}ms")
+            status_desc += f" 延迟 {latency:.0f}ms"
+            status_desc += f" 频率 {self.scheduler.hz():.1f}Hz 抖动 {self.scheduler.jitter_ms():.0f}ms"
+            if self.recorder:
+                status_desc += f" 录像 {self.recorder.bytes_written / 1048576:.1f}MB"
+            if self.frames.dropped or self.frames.stale:
+                status_desc += f" 丢帧 {self.frames.dropped + self.frames.stale}"
+            t_dispatch = time.perf_counter()
+            self.metrics.record("status", (t_dispatch - t_status) * 1000)
+
+            self.event_signal.emit({
+                "event": "alert" if sound_to_play else "safe",
+                "time": wall.isoformat(timespec="milliseconds"),
+                "seq": frame.seq,
+                "sound": sound_to_play,
+                "regions": {r.key: {"client": r.client, "score": round(float(self.results[r.key][1]), 4),
+                                    "threshold": r.threshold, "hit": self.status[r.key],
+                                    "error": self.results[r.key][0], "fresh": r.key in frame.images}
+                            for r in regions},
+                "latency_ms": round(latency, 1),
+                "hz": round(self.scheduler.hz(), 2),
+                "jitter_ms": round(self.scheduler.jitter_ms(), 1),
+                "lateness_ms": round(self.scheduler.lateness_ms(), 1),
+                "dropped": self.frames.dropped + self.frames.stale,
+            })
 
-            status_desc = (f"[L:{int(is_local)}({fmt(score_local, err_local)}) | "
-                           f"O:{int(is_overview)}({fmt(score_overview, err_overview)}) | "
-                           f"M:{int(is_monster)}({fmt(score_monster, err_monster)})]")
-            
             if sound_to_play:
                 log_msg = f"[{now_str}] ⚠️ 触发: {sound_to_play.upper()} {status_desc}"
                 self.log_signal.emit(log_msg)
                 
+                # 报警后不再停 2 秒（那段时间完全看不到画面），改为限制 Webhook 的发送频率
                 webhook = self.cfg.get("webhook_url")
-                if webhook:
+                cooldown = self.cfg.get("webhook_cooldown") or 2.0
+                if webhook and now - self._last_webhook.get(sound_to_play, -cooldown) >= cooldown:
+                    self._last_webhook[sound_to_play] = now
                     try:
                         threading.Thread(target=requests.post, args=(webhook,), kwargs={'json':{'alert':sound_to_play}}).start()
                     except: pass
-                time.sleep(2.0)
             else:
                 log_msg = f"[{now_str}] ✅ 安全 {status_desc}"
                 self.log_signal.emit(log_msg)
-                time.sleep(0.5)
+                # 节奏由截图线程和调度器控制，这里不再固定等待
+
+            # 发出事件 / 日志（界面、无界面输出都在这一步）和 Webhook 线程的耗时
+            end = time.perf_counter()
+            self.metrics.record("dispatch", (end - t_dispatch) * 1000)
+            self.metrics.record("tick", (end - t_tick) * 1000)
@@ -0,0 +1,84 @@
+import threading
+import time
+import numpy as np
+import mss
+from core.frame_source import FrameSource
+
+
+class CaptureManager(FrameSource):
+    """
+    截图管理器（实时截图的画面来源）：
+    - 每个线程持有一个长期存在的 mss 会话，不再每次截图都重新创建
+    - 多个区域合并为一次外接矩形截图，再用 NumPy 切片零拷贝分发给各区域，
+      保证同一帧内各区域来自同一时刻
+    """
+
+    # 外接矩形面积超过各区域面积之和的这个倍数时（例如区域分散在不同显示器上），
+    # 合并截图反而浪费，退回逐区域截图（仍复用同一个会话）
+    MAX_BBOX_WASTE = 4.0
+
+    def __init__(self):
+        super().__init__()
+        self._local = threading.local()
+
+    def _session(self):
+        sct = getattr(self._local, "sct", None)
+        if sct is None:
+            sct = mss.mss()
+            self._local.sct = sct
+        return sct
+
+    def close(self):
+        """关闭当前线程的 mss 会话（工作线程退出前调用）"""
+        sct = getattr(self._local, "sct", None)
+        if sct is not None:
+            try:
+                sct.close()
+            except:
+                pass
+            self._local.sct = None
+
+    def grab(self, region):
+        """截取单个区域，返回 BGRA 数组（直接包装 mss 的原始缓冲区，不复制）"""
+        x, y, w, h = self._to_rect(region)
+        monitor = {"top": y, "left": x, "width": w, "height": h}
+        try:
+            shot = self._session().grab(monitor)
+        except Exception:
+            # 会话可能已失效（例如显示器变动），丢弃后下次重建
+            self.close()
+            raise
+        self.last_grab_time = time.monotonic()
+        return np.frombuffer(shot.raw, np.uint8).reshape(shot.height, shot.width, 4)
+
+    def grab_regions(self, regions):
+        """
+        一次截取多个区域
+        regions: {名称: (x, y, w, h) 或 None}
+        返回 {名称: BGRA 视图 或 None}，各视图共享同一块截图内存
+        """
+        rects = {k: self._to_rect(r) for k, r in regions.items() if r}
+        result = {k: None for k in regions}
+        if not rects:
+            return result
+
+        left = min(r[0] for r in rects.values())
+        top = min(r[1] for r in rects.values())
+        right = max(r[0] + r[2] for r in rects.values())
+        bottom = max(r[1] + r[3] for r in rects.values())
+
+        bbox_area = (right - left) * (bottom - top)
+        used_area = sum(r[2] * r[3] for r in rects.values())
+
+        if len(rects) > 1 and bbox_area > used_area * self.MAX_BBOX_WASTE:
+            for k, r in rects.items():
+                result[k] = self.grab(r)
+            self.last_grab_mode = f"逐区域 x{len(rects)}"
+            return result
+
+        frame = self.grab((left, top, right - left, bottom - top))
+        for k, (x, y, w, h) in rects.items():
+            ox, oy = x - left, y - top
+            result[k] = frame[oy:oy + h, ox:ox + w]
+        self.last_grab_mode = f"合并 {right - left}x{bottom - top}"
+        return result
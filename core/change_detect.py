@@ -0,0 +1,89 @@
+import zlib
+import cv2
+import numpy as np
+
+
+class RegionChangeTracker:
+    """
+    单个区域的变化检测状态（相对上一帧）：
+    - 原始灰度图指纹不变 -> 直接复用上一次的得分，连预处理都省掉
+    - 指纹变化 -> 预处理后按瓦片比较，只对变化瓦片（外扩模板尺寸）重新匹配，
+      未变化位置沿用上一次保存的匹配结果图
+    比较放在预处理之后做，因为 CLAHE 会让局部变化影响到相邻瓦片。
+    """
+
+    # 变化瓦片占比超过这个值时，局部重算不划算，直接全量
+    MAX_DIRTY_RATIO = 0.5
+
+    def __init__(self, tile=32, mode="standard"):
+        self.tile = tile
+        # 匹配模式不同，得分和结果图都不能互相复用
+        self.mode = mode
+        self.reset()
+
+    def reset(self):
+        self.fingerprint = None
+        self.processed = None
+        self.bank = None
+        self.bank_len = 0
+        self.res_maps = None
+        self.score = 0.0
+        self.all_skipped = True
+        # 提前结束时得分只是 >= 当时阈值的下界，不是全库最高分
+        self.exact = True
+
+    @staticmethod
+    def fingerprint_of(gray):
+        return zlib.crc32(np.ascontiguousarray(gray))
+
+    def _same_source(self, shape, bank):
+        return (self.processed is not None
+                and self.processed.shape == shape
+                and self.bank is bank
+                and self.bank_len == len(bank))
+
+    def can_reuse(self, fingerprint, shape, bank, threshold=None):
+        if not self._same_source(shape, bank) or fingerprint != self.fingerprint:
+            return False
+        # 非精确得分只能证明“达到了当时的阈值”，阈值调高后必须重算
+        return self.exact or threshold is None or self.score >= threshold
+
+    def dirty_rects(self, processed, bank):
+        """
+        返回变化区域的像素矩形列表 [(y0, y1, x0, x1)]
+        空列表表示预处理后完全一致；None 表示需要全量重算
+        （没有保存结果图的模式，例如金字塔匹配，也只能全量重算）
+        """
+        if self.res_maps is None or not self._same_source(processed.shape, bank):
+            return None
+
+        h, w = processed.shape[:2]
+        t = self.tile
+        diff = cv2.absdiff(processed, self.processed)
+        # 按瓦片取最大值，得到瓦片级别的变化图
+        tiles = np.maximum.reduceat(diff, np.arange(0, h, t), axis=0)
+        tiles = np.maximum.reduceat(tiles, np.arange(0, w, t), axis=1)
+        dirty = (tiles > 0).astype(np.uint8)
+
+        n_dirty = int(np.count_nonzero(dirty))
+        if n_dirty == 0:
+            return []
+        if n_dirty > dirty.size * self.MAX_DIRTY_RATIO:
+            return None
+
+        n, _, stats, _ = cv2.connectedComponentsWithStats(dirty, connectivity=8)
+        rects = []
+        for i in range(1, n):
+            tx, ty, tw, th = stats[i][:4]
+            rects.append((ty * t, min(h, (ty + th) * t), tx * t, min(w, (tx + tw) * t)))
+        return rects
+
+    def store(self, fingerprint, processed, bank, res_maps, score, all_skipped, exact=True):
+        self.fingerprint = fingerprint
+        self.processed = processed
+        self.bank = bank
+        self.bank_len = len(bank)
+        self.res_maps = res_maps
+        self.score = score
+        self.all_skipped = all_skipped
+        self.exact = exact
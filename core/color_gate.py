@@ -0,0 +1,99 @@
+import cv2
+import numpy as np
+
+
+class ColorGate:
+    """
+    颜色预筛选：
+    模板库加载时统计图标中较亮像素的 HSV 分布，做成一张三维查找表（按模板库保存）。
+    每帧先对彩色截图做一次向量化查表，得到“颜色像图标”的像素掩码，
+    提取连通块并按模板尺寸外扩、合并成若干候选框，之后只在候选框里做灰度匹配；
+    没有候选像素时直接判定安全，连预处理都省掉。
+    查表从模板本身学习，红色敌对图标和灰白色中立图标都能覆盖。
+    """
+
+    H_BINS, S_BINS, V_BINS = 30, 16, 16
+    # 亮度低于这个值的模板像素（背景、描边）不参与学习，否则暗背景会全部通过
+    MIN_V = 60
+    # 连通块至少这么多像素才算候选
+    MIN_BLOB_AREA = 3
+    # 候选框总面积超过区域的这个比例时，预筛选不划算，直接全量匹配
+    MAX_COVERAGE = 0.5
+
+    def __init__(self):
+        self._luts = {}
+
+    def clear(self):
+        self._luts.clear()
+
+    def _bins(self, hsv):
+        h = hsv[..., 0].astype(np.int32) * self.H_BINS // 180
+        s = hsv[..., 1].astype(np.int32) * self.S_BINS // 256
+        v = hsv[..., 2].astype(np.int32) * self.V_BINS // 256
+        return h, s, v
+
+    def learn(self, bank, samples):
+        """samples: [(BGR 图像, alpha 掩码 或 None)]，与 bank 中的模板一一对应"""
+        lut = np.zeros((self.H_BINS, self.S_BINS, self.V_BINS), bool)
+        for bgr, alpha in samples:
+            hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+            keep = hsv[..., 2] >= self.MIN_V
+            if alpha is not None:
+                keep &= alpha > 0
+            h, s, v = self._bins(hsv[keep])
+            lut[h, s, v] = True
+        if not lut.any():
+            return
+        # 各方向外扩一格，容忍渲染带来的颜色偏差
+        grown = lut.copy()
+        for axis in range(3):
+            for step in (1, -1):
+                shifted = np.roll(lut, step, axis=axis)
+                if axis > 0:
+                    # 色相是环形的；饱和度和亮度不是，去掉绕回来的那一层
+                    edge = [slice(None)] * 3
+                    edge[axis] = 0 if step == 1 else -1
+                    shifted[tuple(edge)] = False
+                grown |= shifted
+        self._luts[id(bank)] = (bank, len(bank), grown.ravel())
+
+    def candidates(self, bgr, bank):
+        """
+        返回候选框列表 [(y0, y1, x0, x1)]（已按模板尺寸外扩并合并）
+        空列表表示没有候选；None 表示该模板库没有颜色表或候选太多，需要全量匹配
+        """
+        entry = self._luts.get(id(bank))
+        if entry is None or entry[0] is not bank or entry[1] != len(bank):
+            return None
+        lut = entry[2]
+
+        if bgr.ndim == 3 and bgr.shape[2] == 4:
+            bgr = cv2.cvtColor(bgr, cv2.COLOR_BGRA2BGR)
+        hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+        h, s, v = self._bins(hsv)
+        mask = lut[(h * self.S_BINS + s) * self.V_BINS + v].astype(np.uint8)
+
+        n, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        blobs = stats[1:][stats[1:, cv2.CC_STAT_AREA] >= self.MIN_BLOB_AREA]
+        if len(blobs) == 0:
+            return []
+
+        # 外扩模板尺寸后画到画布上，再取连通块完成合并
+        pad_h = max(t.shape[0] for t, _ in bank)
+        pad_w = max(t.shape[1] for t, _ in bank)
+        height, width = mask.shape
+        canvas = np.zeros_like(mask)
+        for x, y, w, h_, _ in blobs:
+            canvas[max(0, y - pad_h):min(height, y + h_ + pad_h),
+                   max(0, x - pad_w):min(width, x + w + pad_w)] = 1
+
+        n, _, stats, _ = cv2.connectedComponentsWithStats(canvas, connectivity=4)
+        rects = []
+        area = 0
+        for i in range(1, n):
+            x, y, w, h_ = stats[i][:4]
+            rects.append((y, y + h_, x, x + w))
+            area += w * h_
+        if area > height * width * self.MAX_COVERAGE:
+            return None
+        return rects
@@ -1,3 +1,4 @@
+import copy
 import json
 import os
 
@@ -15,7 +16,98 @@ DEFAULT_CONFIG = {
         "overview": 0.95,
         "monster": 0.95
     },
+    # 额外监控区域（多开客户端等），每项：
+    # {"key": "alt1_local", "client": "alt1", "bank": "local", "rect": [x, y, w, h],
+    #  "threshold": 0.95, "priority": 2, "sound": "local"}
+    # bank 为 local / overview / monster，或模板文件夹路径；可选 label / mode / color_gate / list_layout
+    # 未给出的字段按 bank 取内置区域的默认值
+    "extra_regions": [],
+    # 匹配模式："standard" 全分辨率匹配 / "pyramid" 由粗到细金字塔匹配 / "fft" 整库批量 FFT 匹配
+    #          "list" 按行扫描（本地栏）
+    "match_modes": {
+        "local": "standard",
+        "overview": "standard",
+        "monster": "standard"
+    },
+    # 列表模式（match_modes 设为 "list"）的布局：行高 / 图标列 x / 图标在行内的偏移，null 表示自动检测
+    "list_layouts": {
+        "local": {"pitch": None, "column": None, "row_offset": None}
+    },
+    # 按区域覆盖预处理参数（gamma / cutoff / clahe_clip / clahe_tile），空表示用默认值
+    # 例如 {"gamma": 1.3, "cutoff": 20}；模板会按同一套参数另外处理一份
+    "preprocess": {
+        "local": {},
+        "overview": {},
+        "monster": {}
+    },
+    # 颜色预筛选：按图标颜色先找候选区域，没有候选直接判定安全（列表模式下不生效）
+    "color_gates": {
+        "local": False,
+        "overview": False,
+        "monster": False
+    },
+    # 透明图标的匹配后端："ncc" 积分图快速实现 / "opencv" OpenCV 掩码匹配
+    "masked_backend": "ncc",
+    # 提前结束：只判断是否报警时，第一个达到阈值的图标即停止匹配
+    "early_exit": True,
+    # 命中追踪：下一帧先在上次命中位置附近复核，失败再全量扫描
+    "roi_tracking": True,
     "webhook_url": "",
+    # 匹配线程数：三个区域和大模板库并行匹配；建议不超过 CPU 核数的一半，给游戏客户端留出余量
+    "match_threads": 2,
+    # 模板热更新：监控中增删改图标文件夹里的图片会自动生效，无需重启监控
+    "template_hot_reload": True,
+    # 匹配子进程数：多开客户端时把匹配分给多个进程（0 表示在本进程内匹配），修改后需重新启动监控
+    "vision_processes": 0,
+    # 截图间隔（秒），截图与匹配在两个线程里并行；这是每个区域的基准间隔
+    "capture_interval": 0.5,
+    # 按区域单独设置截图间隔（秒），null 表示用 capture_interval；额外区域在自己的配置里写 "interval"
+    "region_intervals": {
+        "local": None,
+        "overview": None,
+        "monster": None
+    },
+    # 自适应调度：区域命中后 hot_hold 秒内按 hot_interval 截图；
+    # 画面连续 idle_after 次没有变化时放慢到 idle_interval
+    "hot_interval": 0.2,
+    "hot_hold": 10.0,
+    "idle_interval": 1.5,
+    "idle_after": 10,
+    # 匹配耗时占墙钟时间的比例上限，超过时所有间隔按比例拉长
+    "cpu_budget": 0.5,
+    # 报警持续期间 Webhook 的最短发送间隔（秒）
+    "webhook_cooldown": 2.0,
+    # 画面来源：type 为 "mss" 实时截图 / "directory" 录好的画面（文件夹、zip 或 npz，用 path / fps / loop）
+    #           "synthetic" 合成画面（density / change_rate / seed）/ "shm" 共享内存（name）
+    "frame_source": {
+        "type": "mss",
+        "path": "",
+        "fps": 0,
+        "loop": True,
+        "density": 0.5,
+        "change_rate": 1.0,
+        "seed": 0,
+        "name": ""
+    },
+    # 会话录像：每次启动监控在 record_folder 下新建一个录像文件，保存匹配用到的画面和当时的得分，
+    # 用 replay.py 回放排查误报 / 漏报；每个区域每 record_keyframe_interval 个变化帧存一张完整画面
+    "record_sessions": False,
+    "record_folder": "recordings",
+    "record_keyframe_interval": 120,
+    # 分阶段耗时统计（截图 / 排队 / 预处理 / 匹配 / 判定 / 日志和报警），保留最近 metrics_window 次的 p50 / p95 / p99；
+    # metrics_port 不为 0 时在 http://127.0.0.1:端口/metrics 提供（Prometheus 格式，/metrics.json 为 JSON），
+    # metrics_file 不为空时每 metrics_interval 秒写一次 JSON
+    "metrics_enabled": False,
+    "metrics_window": 1024,
+    "metrics_port": 0,
+    "metrics_file": "",
+    "metrics_interval": 10.0,
+    # 超过这个时间（秒）还没来得及匹配的帧直接丢弃
+    "max_frame_age": 1.0,
+    # 变化检测：画面未变化时复用上一次的匹配结果
+    "change_detection": True,
+    # 结果缓存：按画面内容记住最近这么多种画面的匹配结果（0 表示关闭）
+    "result_cache_size": 64,
     # 修改点：使用相对路径
     "audio_paths": {
         "local": "assets/sounds/01.wav",
@@ -25,21 +117,28 @@ DEFAULT_CONFIG = {
     }
 }
 
+# 按区域的表：额外区域（alt1_local 等）和额外声音会带来任意新键，加载时整表保留；
+# 其余字典（regions / frame_source）是固定结构，只接受默认值里已有的键
+OPEN_SECTIONS = ("thresholds", "match_modes", "list_layouts", "preprocess", "color_gates",
+                 "region_intervals", "audio_paths")
+
 class ConfigManager:
-    def __init__(self):
-        self.config = DEFAULT_CONFIG.copy()
+    def __init__(self, path=CONFIG_FILE):
+        self.path = path
+        # 深拷贝：加载配置时会改写嵌套的字典，不能改到默认值本身
+        self.config = copy.deepcopy(DEFAULT_CONFIG)
         self.load()
 
     def load(self):
-        if os.path.exists(CONFIG_FILE):
+        if os.path.exists(self.path):
             try:
-                with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+                with open(self.path, 'r', encoding='utf-8') as f:
                     data = json.load(f)
                     for k, v in data.items():
                         if k in self.config:
-                            if isinstance(v, dict):
+                            if isinstance(v, dict) and isinstance(self.config[k], dict):
                                 for sub_k, sub_v in v.items():
-                                    if sub_k in self.config[k]:
+                                    if k in OPEN_SECTIONS or sub_k in self.config[k]:
                                         self.config[k][sub_k] = sub_v
                             else:
                                 self.config[k] = v
@@ -47,7 +146,7 @@ class ConfigManager:
                 print("加载配置文件失败，使用默认配置")
 
     def save(self):
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
+        with open(self.path, 'w', encoding='utf-8') as f:
             json.dump(self.config, f, indent=4)
 
     def get(self, key):
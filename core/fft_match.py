@@ -0,0 +1,139 @@
+from collections import OrderedDict
+import threading
+import cv2
+import numpy as np
+
+
+class FFTBankMatcher:
+    """
+    整库批量 FFT 相关匹配：
+    - 截图只做一次 FFT
+    - 模板预先去均值、补零到同一尺寸并求好共轭频谱，叠成一个栈（按 (模板库, 截图尺寸) 缓存，
+      同一模板库用在不同尺寸的区域上时各占一项，最多保留 MAX_ENTRIES 项，最久未用的先丢弃）
+    - 一次向量化相乘 + 逆变换得到所有模板的相关图，再用积分图算窗口方差完成
+      TM_CCOEFF_NORMED 归一化（边界处理与 OpenCV 一致）
+    - 相关用 float32 计算（与 OpenCV 的得分差在 1e-5 以内），积分图用 float64
+    带透明通道的模板仍走 OpenCV 掩码匹配。
+    """
+
+    # 每批逆变换的模板数，限制峰值内存
+    CHUNK = 8
+    MAX_ENTRIES = 8
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._spectra = OrderedDict()
+        # 多个区域在不同线程里同时匹配
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._spectra.clear()
+
+    def forget(self, bank):
+        """丢掉某个模板库在所有截图尺寸下的缓存（热更新换库时）"""
+        with self._lock:
+            for key in [k for k in self._spectra if k[0] == id(bank)]:
+                del self._spectra[key]
+
+    def _prepare(self, bank, screen_shape):
+        key = (id(bank), screen_shape)
+        with self._lock:
+            entry = self._spectra.get(key)
+            if entry is not None and entry[0] is bank and entry[1] == len(bank):
+                self._spectra.move_to_end(key)
+                return entry[2]
+
+        screen_h, screen_w = screen_shape
+        # 只需要有效区域内无环绕，所以补零到截图尺寸（取 DFT 友好尺寸）即可
+        fft_shape = (cv2.getOptimalDFTSize(screen_h), cv2.getOptimalDFTSize(screen_w))
+
+        indices = []
+        spectra = []
+        norms = []
+        for i, (tmpl, mask) in enumerate(bank):
+            tmpl_h, tmpl_w = tmpl.shape[:2]
+            if mask is not None or screen_h < tmpl_h or screen_w < tmpl_w:
+                continue
+            t = tmpl.astype(np.float32)
+            t -= t.mean()
+            indices.append(i)
+            spectra.append(np.conj(np.fft.rfft2(t, s=fft_shape)))
+            norms.append(float(np.sqrt(np.sum(t * t, dtype=np.float64))))
+
+        if spectra:
+            stack = np.stack(spectra)
+        else:
+            stack = np.empty((0, fft_shape[0], fft_shape[1] // 2 + 1), np.complex64)
+        prepared = (fft_shape, indices, stack, norms)
+        with self._lock:
+            self._spectra[key] = (bank, len(bank), prepared)
+            self._spectra.move_to_end(key)
+            while len(self._spectra) > self.MAX_ENTRIES:
+                self._spectra.popitem(last=False)
+        return prepared
+
+    @staticmethod
+    def _inv_wnd_std(s1, s2, tmpl_h, tmpl_w, rh, rw):
+        """每个窗口标准差（未除以像素数）的倒数，方差为 0 的窗口得到 inf"""
+        wnd_sum = s1[tmpl_h:, tmpl_w:] - s1[:rh, tmpl_w:] - s1[tmpl_h:, :rw] + s1[:rh, :rw]
+        wnd_sqsum = s2[tmpl_h:, tmpl_w:] - s2[:rh, tmpl_w:] - s2[tmpl_h:, :rw] + s2[:rh, :rw]
+        wnd_var = np.maximum(wnd_sqsum - wnd_sum * wnd_sum / (tmpl_h * tmpl_w), 0)
+        with np.errstate(divide="ignore"):
+            return (1.0 / np.sqrt(wnd_var)).astype(np.float32)
+
+    @staticmethod
+    def _normalize(num, inv_wnd_std, tmpl_norm):
+        """与 OpenCV TM_CCOEFF_NORMED 相同的归一化和退化窗口处理"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            res = num * (inv_wnd_std / tmpl_norm)
+            # |r| >= 1 或 inf/nan 只出现在接近纯色的窗口：
+            # OpenCV 在 1.125 倍以内取 ±1，否则取 0
+            bad = ~(np.abs(res) < 1)
+            if bad.any():
+                r = res[bad]
+                res[bad] = np.where(np.abs(r) < 1.125, np.sign(r), 0.0)
+        return res.astype(np.float32, copy=False)
+
+    def score_bank(self, screen, bank):
+        """返回 (最高得分, 是否全部模板尺寸不符, 各模板结果图)"""
+        screen_h, screen_w = screen.shape[:2]
+        fft_shape, indices, stack, norms = self._prepare(bank, (screen_h, screen_w))
+
+        res_maps = [None] * len(bank)
+        all_skipped = True
+
+        if indices:
+            all_skipped = False
+            spectrum = np.fft.rfft2(screen.astype(np.float32), s=fft_shape)
+            # 积分图：每种模板尺寸的窗口和、平方和都从这里取
+            s1, s2 = cv2.integral2(screen, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+            inv_std_by_size = {}
+
+            for start in range(0, len(indices), self.CHUNK):
+                chunk = slice(start, start + self.CHUNK)
+                corr = np.fft.irfft2(spectrum[None] * stack[chunk], s=fft_shape)
+                for j, i in enumerate(indices[chunk]):
+                    tmpl_h, tmpl_w = bank[i][0].shape[:2]
+                    rh, rw = screen_h - tmpl_h + 1, screen_w - tmpl_w + 1
+                    inv_std = inv_std_by_size.get((tmpl_h, tmpl_w))
+                    if inv_std is None:
+                        inv_std = self._inv_wnd_std(s1, s2, tmpl_h, tmpl_w, rh, rw)
+                        inv_std_by_size[(tmpl_h, tmpl_w)] = inv_std
+                    res_maps[i] = self._normalize(corr[j, :rh, :rw], inv_std, norms[start + j])
+
+        # 带掩码的模板单独匹配
+        for i, (tmpl, mask) in enumerate(bank):
+            if mask is None:
+                continue
+            tmpl_h, tmpl_w = tmpl.shape[:2]
+            if screen_h < tmpl_h or screen_w < tmpl_w:
+                continue
+            all_skipped = False
+            try:
+                res_maps[i] = self.engine._match_one(screen, tmpl, mask)
+            except Exception:
+                continue
+
+        scores = [self.engine._map_score(res) for res in res_maps if res is not None]
+        return max(scores, default=0.0), all_skipped, res_maps
@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import deque
+
+
+class Frame:
+    """一次截图：序号、截图开始时间（perf_counter）、各区域图像"""
+
+    def __init__(self, seq, timestamp, images):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.images = images
+
+    def age(self, now=None):
+        return (now if now is not None else time.perf_counter()) - self.timestamp
+
+
+class FrameQueue:
+    """
+    截图线程和匹配线程之间的有界帧队列：
+    - 取帧时直接取最新的帧，更早的帧跳过（匹配跟不上时总是处理最新画面，延迟不会越积越多）；
+      队列满时同样丢弃最旧的帧。跳过 / 丢弃的帧都计入 dropped
+    - 调度器每次只截到期的区域，跳过的帧里有、新帧里没有的区域图像合并到新帧上，不会因为跳帧漏掉
+    - 取帧时丢弃超过 max_age 秒的过期帧（计入 stale），不会迟到地处理旧画面
+    """
+
+    def __init__(self, maxsize=2):
+        self._frames = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self.dropped = 0
+        self.stale = 0
+
+    def put(self, frame):
+        with self._cond:
+            if len(self._frames) == self._frames.maxlen:
+                self.dropped += 1
+                oldest = self._frames.popleft()
+                if self._frames:
+                    self._frames[0].images = {**oldest.images, **self._frames[0].images}
+                else:
+                    frame.images = {**oldest.images, **frame.images}
+            self._frames.append(frame)
+            self._cond.notify()
+
+    def get(self, timeout=None, max_age=None):
+        """取最新的未过期帧（合并了被跳过的帧里的区域图像），等待超时返回 None"""
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        with self._cond:
+            while True:
+                frame = None
+                while self._frames:
+                    newer = self._frames.popleft()
+                    if max_age is not None and newer.age() > max_age:
+                        self.stale += 1
+                        continue
+                    if frame is not None:
+                        self.dropped += 1
+                        newer.images = {**frame.images, **newer.images}
+                    frame = newer
+                if frame is not None:
+                    return frame
+                remaining = None if deadline is None else deadline - time.perf_counter()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def clear(self):
+        with self._cond:
+            self._frames.clear()
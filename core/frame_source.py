@@ -0,0 +1,347 @@
+import glob
+import os
+import struct
+import threading
+import time
+import zipfile
+import cv2
+import numpy as np
+from multiprocessing import shared_memory
+
+
+class FrameSource:
+    """
+    画面来源的公共接口（CaptureManager 即实时截图的实现）：
+    - grab(region)：截取单个区域，返回 BGRA 数组（界面的调试窗口用）
+    - grab_regions({名称: 区域})：一次取一帧里的多个区域，返回 {名称: BGRA 数组 或 None}
+    - close()：释放当前线程持有的资源，下次取帧时再重新打开
+    区域坐标都是屏幕坐标 (x, y, w, h)。
+    """
+
+    def __init__(self):
+        self.last_grab_time = 0.0
+        self.last_grab_mode = "无"
+
+    def grab(self, region):
+        raise NotImplementedError
+
+    def grab_regions(self, regions):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def _to_rect(region):
+        x, y, w, h = (int(v) for v in region[:4])
+        return x, y, w, h
+
+    @staticmethod
+    def _crop(screen, rect):
+        """从整屏图里切出区域（超出画面的部分截掉），完全在画面外返回 None"""
+        x, y, w, h = rect
+        sh, sw = screen.shape[:2]
+        x0, y0, x1, y1 = max(x, 0), max(y, 0), min(x + w, sw), min(y + h, sh)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return screen[y0:y1, x0:x1]
+
+
+def to_bgra(img):
+    """灰度 / BGR / BGRA 统一转成 BGRA，与 mss 截图的格式一致"""
+    if img.ndim == 2:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGRA)
+    if img.shape[2] == 3:
+        return cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
+    return np.ascontiguousarray(img)
+
+
+class DirectorySource(FrameSource):
+    """
+    录好的整屏画面：一个文件夹里的图片、一个 zip 包里的图片，或一个 npz（每个数组一帧），按文件名排序。
+    grab_regions 每调用一次前进一帧（fps 不为 0 时改为按真实时间推进），放完后从头循环（loop=False 时停在最后一帧）；
+    grab 只看当前帧、不前进，调试窗口看画面不会影响监控取帧。
+    """
+
+    EXTENSIONS = ('.png', '.jpg', '.bmp')
+
+    def __init__(self, path, fps=0, loop=True):
+        super().__init__()
+        self.path = path
+        self.fps = fps
+        self.loop = loop
+        self.index = -1
+        self._lock = threading.Lock()
+        self._current = None
+        self._started = None
+        self._names, self._read = self._open(path)
+        if not self._names:
+            raise ValueError(f"没有可用的画面: {path}")
+
+    def _open(self, path):
+        if os.path.isdir(path):
+            names = sorted(p for p in glob.glob(os.path.join(path, "*")) if p.lower().endswith(self.EXTENSIONS))
+            return names, lambda name: cv2.imread(name, cv2.IMREAD_UNCHANGED)
+        if path.lower().endswith(".npz"):
+            data = np.load(path)
+            return sorted(data.files), lambda name: data[name]
+        if zipfile.is_zipfile(path):
+            archive = zipfile.ZipFile(path)
+            names = sorted(n for n in archive.namelist() if n.lower().endswith(self.EXTENSIONS))
+            return names, lambda name: cv2.imdecode(np.frombuffer(archive.read(name), np.uint8), cv2.IMREAD_UNCHANGED)
+        raise ValueError(f"不支持的画面来源: {path}")
+
+    def __len__(self):
+        return len(self._names)
+
+    def _frame(self, index):
+        if self._current is None or self._current[0] != index:
+            self._current = (index, to_bgra(self._read(self._names[index])))
+        return self._current[1]
+
+    def _advance(self):
+        if self.fps:
+            if self._started is None:
+                self._started = time.perf_counter()
+            index = int((time.perf_counter() - self._started) * self.fps)
+        else:
+            index = self.index + 1
+        if index >= len(self._names):
+            index = index % len(self._names) if self.loop else len(self._names) - 1
+        self.index = index
+
+    def grab(self, region):
+        with self._lock:
+            screen = self._frame(max(self.index, 0))
+        return self._crop(screen, self._to_rect(region))
+
+    def grab_regions(self, regions):
+        with self._lock:
+            self._advance()
+            screen = self._frame(self.index)
+        self.last_grab_time = time.monotonic()
+        self.last_grab_mode = f"回放 {self.index + 1}/{len(self._names)}"
+        return {k: (self._crop(screen, self._to_rect(r)) if r else None) for k, r in regions.items()}
+
+
+class SyntheticSource(FrameSource):
+    """
+    合成画面：在 EVE 风格的深色噪点背景（星云 + 噪点 + 零星亮点）上按给定密度贴入模板图标，
+    不需要游戏客户端就能得到可重复的画面（固定 seed 时每次运行完全相同）。
+    - icons：{模板库名: 图标文件夹}，贴图时保留 PNG 的透明通道
+    - density：每个区域每帧平均贴入的图标数（泊松分布，0 表示永远是空画面）
+    - change_rate：每帧每个区域重新生成画面的概率，其余时候与上一帧完全相同（模拟画面静止）
+    last_truth 记录最近一帧每个区域实际贴入的图标 [(模板库名, 文件名, x, y)]，作为标注。
+    """
+
+    def __init__(self, icons, density=0.5, change_rate=1.0, seed=0, banks=None):
+        super().__init__()
+        self.density = density
+        self.change_rate = change_rate
+        self.rng = np.random.default_rng(seed)
+        # 区域 key -> 只往这个区域贴哪些库的图标（不指定时用全部图标）
+        self.banks = banks or {}
+        self.icons = {name: self._load_icons(folder) for name, folder in icons.items()}
+        self.last_truth = {}
+        self._last = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load_icons(folder):
+        icons = []
+        for path in sorted(glob.glob(os.path.join(folder, "*"))):
+            if not path.lower().endswith(DirectorySource.EXTENSIONS):
+                continue
+            img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+            if img is None:
+                continue
+            img = to_bgra(img)
+            alpha = img[:, :, 3:4].astype(np.float32) / 255.0
+            icons.append((os.path.basename(path), img[:, :, :3].astype(np.float32), alpha))
+        return icons
+
+    def _background(self, h, w):
+        rng = self.rng
+        # 低频星云：小尺寸噪声放大后带一点蓝紫色调
+        nebula = cv2.resize(rng.random((max(h // 32, 2), max(w // 32, 2), 3)).astype(np.float32),
+                            (w, h), interpolation=cv2.INTER_CUBIC) * np.float32([30, 12, 18])
+        img = nebula + rng.random((h, w, 1)).astype(np.float32) * 25
+        img[rng.random((h, w)) > 0.997] = 200
+        return img
+
+    def _render(self, key, rect):
+        x, y, w, h = rect
+        img = self._background(h, w)
+        pool = [(bank, icon) for bank in self.banks.get(key, self.icons) for icon in self.icons.get(bank, [])]
+        truth = []
+        for _ in range(int(self.rng.poisson(self.density)) if pool and self.density > 0 else 0):
+            bank, (name, bgr, alpha) = pool[int(self.rng.integers(len(pool)))]
+            th, tw = bgr.shape[:2]
+            if th > h or tw > w:
+                continue
+            oy, ox = int(self.rng.integers(0, h - th + 1)), int(self.rng.integers(0, w - tw + 1))
+            roi = img[oy:oy + th, ox:ox + tw]
+            roi[:] = bgr * alpha + roi * (1.0 - alpha)
+            truth.append((bank, name, ox, oy))
+        bgra = np.empty((h, w, 4), np.uint8)
+        np.clip(img, 0, 255, out=img)
+        bgra[:, :, :3] = img
+        bgra[:, :, 3] = 255
+        return bgra, truth
+
+    def _region(self, key, rect):
+        last = self._last.get(key)
+        if last is None or last[0] != rect or self.rng.random() < self.change_rate:
+            img, truth = self._render(key, rect)
+            self._last[key] = (rect, img, truth)
+            return img, truth
+        return last[1], last[2]
+
+    def grab(self, region):
+        rect = self._to_rect(region)
+        with self._lock:
+            for last_rect, img, _ in self._last.values():
+                if last_rect == rect:
+                    return img
+            return self._render(None, rect)[0]
+
+    def grab_regions(self, regions):
+        result = {}
+        truth = {}
+        with self._lock:
+            for k, r in regions.items():
+                if not r:
+                    result[k] = None
+                    continue
+                result[k], truth[k] = self._region(k, self._to_rect(r))
+            self.last_truth = truth
+        self.last_grab_time = time.monotonic()
+        self.last_grab_mode = f"合成 x{len(truth)}"
+        return result
+
+
+class SharedMemoryFrame:
+    """
+    共享内存里的一块整屏画面（外部截图程序或另一个进程写入，SharedMemorySource 读取）：
+    头部 32 字节 = 序号、高、宽、通道数（各 8 字节），之后是像素数据。
+    写入时序号先变成奇数、写完再变成偶数；读取时序号前后不一致（或为奇数）就重读，不会读到写了一半的画面。
+    """
+
+    HEADER = struct.Struct("<4Q")
+
+    @classmethod
+    def create(cls, name, height, width, channels=4):
+        shm = shared_memory.SharedMemory(name=name, create=True, size=cls.HEADER.size + height * width * channels)
+        cls.HEADER.pack_into(shm.buf, 0, 0, height, width, channels)
+        return cls(shm)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(shared_memory.SharedMemory(name=name))
+
+    def __init__(self, shm):
+        self.shm = shm
+
+    def header(self):
+        return self.HEADER.unpack_from(self.shm.buf, 0)
+
+    def _pixels(self, height, width, channels):
+        return np.ndarray((height, width, channels), np.uint8, self.shm.buf, offset=self.HEADER.size)
+
+    def write(self, img):
+        seq, height, width, channels = self.header()
+        img = to_bgra(img) if channels == 4 else img
+        self.HEADER.pack_into(self.shm.buf, 0, seq + 1, height, width, channels)
+        self._pixels(height, width, channels)[:] = img
+        self.HEADER.pack_into(self.shm.buf, 0, seq + 2, height, width, channels)
+
+    def read(self, rects, retries=20):
+        """按屏幕坐标复制出各区域，返回 ({名称: 数组 或 None}, 序号)"""
+        for _ in range(retries):
+            seq, height, width, channels = self.header()
+            if seq % 2:
+                time.sleep(0.0005)
+                continue
+            screen = self._pixels(height, width, channels)
+            out = {}
+            for k, rect in rects.items():
+                view = FrameSource._crop(screen, rect)
+                out[k] = None if view is None else to_bgra(view.copy())
+            if self.header()[0] == seq:
+                return out, seq
+        raise TimeoutError("共享内存画面一直在写入中")
+
+    def close(self):
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+class SharedMemorySource(FrameSource):
+    """从共享内存读取整屏画面（见 SharedMemoryFrame），按需连接，close 后下次取帧时重新连接"""
+
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+        self._local = threading.local()
+        self.last_seq = None
+
+    def _frame(self):
+        frame = getattr(self._local, "frame", None)
+        if frame is None:
+            frame = SharedMemoryFrame.attach(self.name)
+            self._local.frame = frame
+        return frame
+
+    def close(self):
+        frame = getattr(self._local, "frame", None)
+        if frame is not None:
+            frame.close()
+            self._local.frame = None
+
+    def grab(self, region):
+        return self._frame().read({0: self._to_rect(region)})[0][0]
+
+    def grab_regions(self, regions):
+        rects = {k: self._to_rect(r) for k, r in regions.items() if r}
+        images, self.last_seq = self._frame().read(rects)
+        self.last_grab_time = time.monotonic()
+        self.last_grab_mode = f"共享内存 #{self.last_seq // 2}"
+        return {k: images.get(k) for k in regions}
+
+
+def default_icon_folders():
+    base_dir = os.getcwd()
+    return {
+        "local": os.path.join(base_dir, "assets", "hostile_icons_local"),
+        "overview": os.path.join(base_dir, "assets", "hostile_icons_overview"),
+        "monster": os.path.join(base_dir, "assets", "monster_icons"),
+    }
+
+
+def make_source(spec):
+    """
+    按配置创建画面来源；spec 为 None / {} 时返回 None（用实时截图）：
+      {"type": "mss"}
+      {"type": "directory", "path": "recordings/xxx", "fps": 0, "loop": true}   # 文件夹 / zip / npz
+      {"type": "synthetic", "density": 0.5, "change_rate": 1.0, "seed": 0, "icons": {库名: 文件夹}}
+      {"type": "shm", "name": "eve_frames"}
+      {"type": "recording", "path": "recordings/xxx.everec", "loop": false}   # 会话录像（见 core/recorder.py）
+    """
+    if not spec or spec.get("type", "mss") == "mss":
+        return None
+    kind = spec["type"]
+    if kind == "directory":
+        return DirectorySource(spec["path"], fps=spec.get("fps", 0), loop=spec.get("loop", True))
+    if kind == "synthetic":
+        # 默认只往每个内置区域贴它自己那个库的图标
+        return SyntheticSource(spec.get("icons") or default_icon_folders(), density=spec.get("density", 0.5),
+                               change_rate=spec.get("change_rate", 1.0), seed=spec.get("seed", 0),
+                               banks=spec.get("banks") or {k: [k] for k in ("local", "overview", "monster")})
+    if kind == "shm":
+        return SharedMemorySource(spec["name"])
+    if kind == "recording":
+        from core.recorder import RecordingSource
+        return RecordingSource(spec["path"], loop=spec.get("loop", False))
+    raise ValueError(f"未知的画面来源: {kind}")
@@ -0,0 +1,205 @@
+import numpy as np
+
+
+class ListScanner:
+    """
+    本地成员列表的按行扫描（列表模式）：
+    本地栏是固定行高的竖向列表，声望图标总在同一列。因此：
+    1. 行高：由预处理后每行亮度的自相关求出（或取自配置），按截图尺寸缓存
+    2. 图标列和图标在行内的偏移：取自配置，或从第一次全量扫描的命中位置学习
+    3. 行相位：校准时记下按行高折叠后的行亮度曲线作为参考，之后每帧与参考曲线做循环
+       互相关求出相对平移，滚动列表后也能跟上（不再每帧取最暗位置，行间隙那一段
+       亮度几乎是平的，最小值的位置会来回跳）
+    校准完成后，每行只截取图标所在的小格子（外扩 JITTER 像素），所有格子竖着拼成一张
+    窄图，每个模板只需一次 matchTemplate，就能得到每一行的得分和敌对人数。
+    未校准时退回全量扫描。校准后先做 VERIFY_FRAMES 次按行扫描和全量扫描的对比，判定结果
+    （是否超过阈值）全部一致才启用按行扫描；之后每隔 FULL_SCAN_EVERY 次再对比一次，
+    不一致就重新校准，累计 MAX_VERIFY_FAILURES 次不一致则该区域一直走全量扫描。
+    """
+
+    JITTER = 4
+    MIN_PITCH = 12
+    MAX_PITCH = 64
+    # 自相关峰值低于这个值时认为不是列表，不启用按行扫描
+    MIN_PITCH_CONFIDENCE = 0.3
+    FULL_SCAN_EVERY = 50
+    VERIFY_FRAMES = 3
+    MAX_VERIFY_FAILURES = 3
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.layouts = {}
+
+    def clear(self):
+        self.layouts.clear()
+
+    def _layout(self, key, shape, config):
+        layout = self.layouts.get(key)
+        if layout is None or layout["shape"] != shape:
+            layout = {"shape": shape, "pitch": None, "column": None, "row_offset": None, "ticks": 0,
+                      "reference": None, "base": None, "agreed": 0, "verified": False, "failures": 0,
+                      "disabled": False}
+            self.layouts[key] = layout
+        # 配置中给出的值优先
+        config = config or {}
+        for name in ("pitch", "column", "row_offset"):
+            value = config.get(name)
+            if value is not None and value >= 0:
+                layout[name] = int(value)
+        return layout
+
+    def detect_pitch(self, processed):
+        """行亮度曲线的自相关峰值即行高"""
+        profile = processed.mean(axis=1)
+        profile = profile - profile.mean()
+        energy = float(np.dot(profile, profile))
+        max_lag = min(self.MAX_PITCH, len(profile) // 3)
+        if energy == 0 or max_lag <= self.MIN_PITCH:
+            return None
+        corr = np.array([np.dot(profile[:-lag], profile[lag:]) for lag in range(self.MIN_PITCH, max_lag + 1)])
+        corr /= energy
+        best = int(np.argmax(corr))
+        if corr[best] < self.MIN_PITCH_CONFIDENCE:
+            return None
+        return self.MIN_PITCH + best
+
+    @staticmethod
+    def folded_profile(processed, pitch):
+        """按行高折叠后的行亮度曲线（长度 pitch，已去均值）"""
+        profile = processed.mean(axis=1)
+        n = len(profile) // pitch * pitch
+        folded = profile[:n].reshape(-1, pitch).mean(axis=0)
+        return folded - folded.mean()
+
+    @staticmethod
+    def row_phase(processed, pitch):
+        """行间隙所在的相位（0..pitch-1），只在校准时用来换算配置给出的 row_offset"""
+        return int(np.argmin(ListScanner.folded_profile(processed, pitch)))
+
+    @staticmethod
+    def phase_shift(reference, folded):
+        """当前曲线相对参考曲线向下平移的行数（循环互相关的峰值）"""
+        pitch = len(reference)
+        corr = [np.dot(reference, np.roll(folded, -s)) for s in range(pitch)]
+        return int(np.argmax(corr))
+
+    def _anchor(self, layout, processed, y=None):
+        """
+        记下参考曲线和图标在参考帧中的行内位置 base（0..pitch-1）
+        y 为命中位置；没有命中位置时由配置的 row_offset 按参考帧的行间隙换算
+        """
+        pitch = layout["pitch"]
+        layout["reference"] = self.folded_profile(processed, pitch)
+        if y is None:
+            y = self.row_phase(processed, pitch) + layout["row_offset"]
+        layout["base"] = int(y % pitch)
+
+    def _learn(self, layout, processed, loc):
+        """从一次命中的位置学习图标列和图标在行内的偏移"""
+        if layout["pitch"] is None:
+            return
+        x, y = loc
+        if layout["column"] is None:
+            layout["column"] = int(x)
+        if layout["row_offset"] is None:
+            layout["row_offset"] = int(y % layout["pitch"])
+            self._anchor(layout, processed, y)
+
+    def _reset(self, layout):
+        """按行扫描和全量扫描结论不一致：丢掉学到的位置，下次重新校准"""
+        layout["column"] = layout["row_offset"] = None
+        layout["reference"] = layout["base"] = None
+        layout["agreed"] = 0
+        layout["verified"] = False
+        layout["failures"] += 1
+        if layout["failures"] >= self.MAX_VERIFY_FAILURES:
+            layout["disabled"] = True
+
+    def _cells(self, processed, layout, cell_h, cell_w):
+        """每一行图标格子的左上角坐标（只保留完整落在截图内的行）"""
+        h, w = processed.shape[:2]
+        pitch = layout["pitch"]
+        shift = self.phase_shift(layout["reference"], self.folded_profile(processed, pitch))
+        first = (layout["base"] + shift) % pitch - self.JITTER
+        ys = np.arange(first, h - cell_h + 1, pitch)
+        ys = ys[ys >= 0]
+        x = layout["column"] - self.JITTER
+        if x < 0 or x + cell_w > w:
+            return ys[:0], x
+        return ys, x
+
+    def score_bank(self, key, processed, bank, threshold, config=None):
+        """
+        返回 (最高得分, 是否全部模板尺寸不符, 每行是否命中)
+        每行是否命中为 None 表示本次走的是全量扫描
+        """
+        layout = self._layout(key, processed.shape, config)
+        if layout["pitch"] is None:
+            layout["pitch"] = self.detect_pitch(processed)
+        layout["ticks"] += 1
+
+        if layout["disabled"]:
+            max_score, all_skipped, _ = self.engine._score_full(processed, bank)
+            return max_score, all_skipped, None
+
+        calibrated = layout["pitch"] is not None and layout["column"] is not None and layout["row_offset"] is not None
+        if not calibrated:
+            max_score, all_skipped, res_maps = self.engine._score_full(processed, bank)
+            if max_score >= threshold:
+                peaks = [self.engine._map_peak(res) for res in res_maps if res is not None]
+                val, loc = max(peaks, key=lambda p: p[0])
+                if loc is not None:
+                    self._learn(layout, processed, loc)
+            return max_score, all_skipped, None
+
+        if layout["reference"] is None:
+            # 位置全部来自配置，以这一帧为参考
+            self._anchor(layout, processed)
+
+        listed = self._score_rows(processed, layout, bank, threshold)
+        if listed is None:
+            # 布局对不上（区域被改过），下次重新校准
+            self.layouts.pop(key, None)
+            max_score, all_skipped, _ = self.engine._score_full(processed, bank)
+            return max_score, all_skipped, None
+
+        if layout["verified"] and layout["ticks"] % self.FULL_SCAN_EVERY != 0:
+            return listed
+
+        # 未验证或定期复查：同时做全量扫描，结论不一致就不用按行扫描
+        max_score, all_skipped, _ = self.engine._score_full(processed, bank)
+        if (listed[0] >= threshold) == (max_score >= threshold):
+            layout["agreed"] += 1
+            if layout["agreed"] >= self.VERIFY_FRAMES:
+                layout["verified"] = True
+        else:
+            self._reset(layout)
+        return max_score, all_skipped, None
+
+    def _score_rows(self, processed, layout, bank, threshold):
+        """按行扫描；格子超出截图时返回 None"""
+        tmpl_h = max(t.shape[0] for t, _ in bank)
+        tmpl_w = max(t.shape[1] for t, _ in bank)
+        cell_h, cell_w = tmpl_h + 2 * self.JITTER, tmpl_w + 2 * self.JITTER
+        ys, x = self._cells(processed, layout, cell_h, cell_w)
+        if len(ys) == 0:
+            return None
+
+        # 所有行的格子竖着拼成一张窄图
+        rows = ys[:, None] + np.arange(cell_h)[None, :]
+        mosaic = processed[rows, x:x + cell_w].reshape(len(ys) * cell_h, cell_w)
+
+        row_scores = np.zeros(len(ys), np.float32)
+        for tmpl, mask in bank:
+            th, tw = tmpl.shape[:2]
+            try:
+                res = self.engine._match_one(mosaic, tmpl, mask)
+            except Exception:
+                continue
+            # 补齐到每行 cell_h 个结果，只取不跨行的位置
+            full = np.zeros((len(ys) * cell_h, res.shape[1]), np.float32)
+            full[:res.shape[0]] = np.where(np.isfinite(res), res, 0)
+            per_row = full.reshape(len(ys), cell_h, -1)[:, :cell_h - th + 1].max(axis=(1, 2))
+            np.maximum(row_scores, per_row, out=row_scores)
+
+        return float(row_scores.max()), False, row_scores >= threshold
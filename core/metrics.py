@@ -0,0 +1,179 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.name, (time.perf_counter() - self.start) * 1000)
+        return False
+
+
+class Metrics:
+    """
+    分阶段耗时统计：每个名字保留最近 window 个样本（毫秒），查询时算 p50 / p95 / p99。
+    关闭时 record 直接返回、timer 返回同一个空的上下文，对监控循环几乎没有开销。
+    名字约定：capture / queue / match / preprocess/<区域> / match/<模板库> / template/<模板文件名>
+             / decision / status / dispatch / tick
+    """
+
+    def __init__(self, window=1024):
+        self.enabled = False
+        self.window = window
+        self._samples = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def configure(self, enabled, window=None):
+        if window and window != self.window:
+            self.window = window
+            self.reset()
+        self.enabled = bool(enabled)
+
+    def reset(self):
+        with self._lock:
+            self._samples = {}
+            self._counts = {}
+
+    def record(self, name, ms):
+        if not self.enabled:
+            return
+        samples = self._samples.get(name)
+        if samples is None:
+            with self._lock:
+                samples = self._samples.setdefault(name, deque(maxlen=self.window))
+        # deque.append 本身是线程安全的；计数偶尔少记一次不影响统计
+        samples.append(ms)
+        self._counts[name] = self._counts.get(name, 0) + 1
+
+    def timer(self, name):
+        """with metrics.timer("capture"): ...  关闭时返回空上下文"""
+        return _Timer(self, name) if self.enabled else _NULL_TIMER
+
+    def snapshot(self):
+        """{名字: {count, mean, p50, p95, p99, max}}，count 是累计次数，其余基于最近 window 个样本"""
+        with self._lock:
+            items = [(name, list(samples)) for name, samples in self._samples.items()]
+        result = {}
+        for name, values in sorted(items):
+            if not values:
+                continue
+            arr = np.asarray(values, np.float64)
+            p50, p95, p99 = np.percentile(arr, (50, 95, 99))
+            result[name] = {"count": self._counts.get(name, len(values)), "mean": round(float(arr.mean()), 3),
+                            "p50": round(float(p50), 3), "p95": round(float(p95), 3), "p99": round(float(p99), 3),
+                            "max": round(float(arr.max()), 3)}
+        return result
+
+    def to_prometheus(self):
+        """Prometheus 文本格式（summary），名字放在 stage 标签里"""
+        lines = ["# TYPE eve_stage_ms summary"]
+        for name, s in self.snapshot().items():
+            label = name.replace("\\", "\\\\").replace('"', '\\"')
+            for q in ("p50", "p95", "p99"):
+                lines.append(f'eve_stage_ms{{stage="{label}",quantile="0.{q[1:]}"}} {s[q]}')
+            lines.append(f'eve_stage_ms_count{{stage="{label}"}} {s["count"]}')
+        return "\n".join(lines) + "\n"
+
+
+# 全局实例：截图、匹配、监控循环都往这里记
+metrics = Metrics()
+
+
+class MetricsServer:
+    """
+    本机统计接口（只监听 127.0.0.1）：
+        GET /metrics        Prometheus 文本格式
+        GET /metrics.json   JSON（与 Metrics.snapshot 相同）
+    """
+
+    def __init__(self, registry, port, host="127.0.0.1"):
+        self.registry = registry
+        registry_ref = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path == "/metrics":
+                    body, ctype = registry_ref.to_prometheus().encode("utf-8"), "text/plain; version=0.0.4"
+                elif path in ("/", "/metrics.json"):
+                    body, ctype = json.dumps(registry_ref.snapshot()).encode("utf-8"), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+class MetricsDumper:
+    """定期把统计写到 JSON 文件（先写临时文件再替换，读取方不会读到一半）"""
+
+    def __init__(self, registry, path, interval=10.0):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def dump(self):
+        data = {"time": time.time(), "stages": self.registry.snapshot()}
+        tmp = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=1, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.dump()
+
+    def stop(self):
+        self._stop.set()
+        self.thread.join()
+        self.dump()
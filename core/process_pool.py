@@ -0,0 +1,149 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+
+
+def _worker_main(conn):
+    """
+    子进程：常驻一个 VisionEngine（模板库只加载、预处理一次），
+    循环接收 (区域, 共享内存名, 形状, 模板库名, 阈值, 参数) 批次并返回匹配结果
+    """
+    from core.vision import VisionEngine
+    vision = VisionEngine()
+    # 模板库加载完成后通知主进程
+    conn.send(vision.template_status_msg)
+    # 共享内存由主进程创建和释放，这里只挂载（子进程与主进程共用资源回收器）
+    attached = {}
+    try:
+        while True:
+            msg = conn.recv()
+            if msg[0] == "stop":
+                break
+            if msg[0] == "reload":
+                vision.load_templates()
+                conn.send(vision.template_status_msg)
+                continue
+
+            _, settings, jobs = msg
+            vision.apply_settings(settings)
+
+            results = {}
+            for key, shm_name, shape, bank, threshold, options in jobs:
+                shm = attached.get(key)
+                if shm is None or shm.name != shm_name:
+                    # 主进程重新分配了该区域的共享内存
+                    if shm is not None:
+                        shm.close()
+                    shm = attached[key] = shared_memory.SharedMemory(name=shm_name)
+                img = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+                try:
+                    results[key] = vision.match_templates(img, vision.get_bank(bank, options.get("preprocess")), threshold, True, key=key, **options)
+                except Exception as e:
+                    results[key] = (f"匹配失败: {e}", 0.0)
+                del img
+            conn.send(results)
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        for shm in attached.values():
+            shm.close()
+        vision.capture.close()
+
+
+class ProcessMatchPool:
+    """
+    多进程匹配后端（多开客户端时使用）：
+    - 每个子进程常驻预处理好的三套模板库
+    - 截图写入按区域分配的共享内存，只把共享内存名和形状发给子进程，不做序列化
+    - 同一个区域总是交给同一个子进程，变化检测、命中追踪等按区域保存的状态继续有效
+    match_regions 的结果格式与 VisionEngine.match_regions 相同，
+    区别是任务里给的是模板库名（见 VisionEngine.get_bank）而不是模板列表。
+    """
+
+    def __init__(self, processes=2):
+        ctx = mp.get_context("spawn")
+        self.processes = []
+        self.conns = []
+        for _ in range(max(1, processes)):
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(target=_worker_main, args=(child,), daemon=True)
+            proc.start()
+            child.close()
+            self.processes.append(proc)
+            self.conns.append(parent)
+        self.routes = {}
+        self.buffers = {}
+        # 等所有子进程加载完模板库再返回，第一帧不会被启动时间拖慢；有子进程启动失败就全部关掉
+        try:
+            self.report = [conn.recv() for conn in self.conns][0]
+        except (EOFError, OSError):
+            self.close()
+            raise
+
+    def _route(self, key):
+        """区域按首次出现的顺序轮流分配给子进程"""
+        if key not in self.routes:
+            self.routes[key] = len(self.routes) % len(self.conns)
+        return self.routes[key]
+
+    def _buffer(self, key, img):
+        """把截图复制进该区域的共享内存（尺寸变大时重新分配）"""
+        shm = self.buffers.get(key)
+        if shm is None or shm.size < img.nbytes:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            shm = shared_memory.SharedMemory(create=True, size=max(img.nbytes, 1))
+            self.buffers[key] = shm
+        np.ndarray(img.shape, dtype=np.uint8, buffer=shm.buf)[...] = img
+        return shm.name
+
+    def match_regions(self, jobs, settings=None):
+        """
+        jobs: {key: (截图, 模板库名, 阈值, match_templates 的其余关键字参数)}
+        settings: 引擎级设置（见 core/audio_logic.vision_settings），每批都发给子进程，配置修改立即生效
+        返回 {key: (错误信息, 得分)}，顺序与 jobs 一致
+        """
+        batches = [[] for _ in self.conns]
+        results = {}
+        for key, (img, bank, threshold, options) in jobs.items():
+            if img is None:
+                results[key] = ("未获取到截图", 0.0)
+                continue
+            name = self._buffer(key, img)
+            batches[self._route(key)].append((key, name, img.shape, bank, threshold, options))
+
+        busy = []
+        for conn, batch in zip(self.conns, batches):
+            if batch:
+                conn.send(("match", settings or {}, batch))
+                busy.append(conn)
+        for conn in busy:
+            results.update(conn.recv())
+        return {key: results[key] for key in jobs}
+
+    def reload(self):
+        """所有子进程重新加载模板库，返回第一个子进程的加载报告"""
+        for conn in self.conns:
+            conn.send(("reload",))
+        reports = [conn.recv() for conn in self.conns]
+        return reports[0]
+
+    def close(self):
+        for conn in self.conns:
+            try:
+                conn.send(("stop",))
+            except (OSError, BrokenPipeError):
+                pass
+        for proc in self.processes:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+        for conn in self.conns:
+            conn.close()
+        for shm in self.buffers.values():
+            shm.close()
+            shm.unlink()
+        self.buffers.clear()
+        self.processes = []
+        self.conns = []
@@ -0,0 +1,167 @@
+import time
+import cv2
+import numpy as np
+
+
+class PyramidMatcher:
+    """
+    由粗到细的金字塔匹配：
+    1. 截图和模板一起 pyrDown，在低分辨率上找候选位置
+    2. 只在候选位置附近用原分辨率 TM_CCOEFF_NORMED 复核
+    返回的得分始终是原分辨率下的真实得分，阈值含义与普通模式一致。
+    定期同时跑一次全量匹配做校准，得到实测加速比和结果一致率。
+    """
+
+    MAX_LEVELS = 2
+    # 缩小后模板最短边不能小于这个值，太小的模板粗匹配不可靠，直接全分辨率匹配
+    MIN_COARSE_SIDE = 8
+    # 粗匹配阈值 = 报警阈值 - 余量（低分辨率下得分会偏低）
+    COARSE_MARGIN = 0.25
+    # 每个模板最多复核的候选峰值数（得分最高的峰值总会被复核）
+    MAX_CANDIDATES = 8
+    # 每隔多少次调用做一次全量校准
+    CALIBRATE_EVERY = 100
+    EMA_ALPHA = 0.2
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._prepared = {}
+        self.stats = {}
+
+    def clear(self):
+        self._prepared.clear()
+
+    def _prepare(self, bank):
+        """为模板库生成各层缩小模板（按模板库缓存）"""
+        entry = self._prepared.get(id(bank))
+        if entry is not None and entry[0] is bank and entry[1] == len(bank):
+            return entry[2]
+
+        levels = []
+        for tmpl, mask in bank:
+            pyr = []
+            t, m = tmpl, mask
+            for _ in range(self.MAX_LEVELS):
+                if min(t.shape[:2]) // 2 < self.MIN_COARSE_SIDE:
+                    break
+                t = cv2.pyrDown(t)
+                if m is not None:
+                    m = cv2.resize(m, (t.shape[1], t.shape[0]), interpolation=cv2.INTER_NEAREST)
+                pyr.append((t, m))
+            levels.append(pyr)
+
+        self._prepared[id(bank)] = (bank, len(bank), levels)
+        return levels
+
+    def _candidates(self, coarse, coarse_thresh):
+        """粗匹配结果中的局部峰值（超过粗阈值的前 N 个 + 全局最大值）"""
+        coarse = np.nan_to_num(coarse, nan=-1.0, posinf=-1.0, neginf=-1.0)
+        best = np.unravel_index(int(np.argmax(coarse)), coarse.shape)
+
+        peaks = (coarse >= cv2.dilate(coarse, np.ones((3, 3), np.uint8))) & (coarse >= coarse_thresh)
+        ys, xs = np.nonzero(peaks)
+        if len(ys) > self.MAX_CANDIDATES:
+            top = np.argpartition(-coarse[ys, xs], self.MAX_CANDIDATES)[:self.MAX_CANDIDATES]
+            ys, xs = ys[top], xs[top]
+
+        cands = {(int(best[0]), int(best[1]))}
+        cands.update(zip(ys.tolist(), xs.tolist()))
+        return cands
+
+    def _score_pyramid(self, screen, bank, threshold, stop_at=None):
+        levels = self._prepare(bank)
+        screen_h, screen_w = screen.shape[:2]
+        screen_pyr = [screen]
+
+        max_score_found = 0.0
+        all_skipped = True
+
+        # 提前结束时按命中顺序匹配，与全分辨率模式共用同一份顺序
+        order = self.engine._hit_order(bank) if stop_at is not None else range(len(bank))
+
+        for i in list(order):
+            (tmpl, mask), pyr = bank[i], levels[i]
+            tmpl_h, tmpl_w = tmpl.shape[:2]
+            if screen_h < tmpl_h or screen_w < tmpl_w:
+                continue
+            all_skipped = False
+
+            try:
+                # 选取截图尺寸仍然容得下模板的最深一层
+                level = len(pyr)
+                while level > 0:
+                    while len(screen_pyr) <= level:
+                        screen_pyr.append(cv2.pyrDown(screen_pyr[-1]))
+                    ct = pyr[level - 1][0]
+                    cs = screen_pyr[level]
+                    if cs.shape[0] >= ct.shape[0] and cs.shape[1] >= ct.shape[1]:
+                        break
+                    level -= 1
+
+                if level == 0:
+                    max_val = self.engine._map_score(self.engine._match_one(screen, tmpl, mask))
+                else:
+                    ct, cm = pyr[level - 1]
+                    coarse = self.engine._match_one(screen_pyr[level], ct, cm)
+                    scale = 1 << level
+                    pad = scale + 1
+                    max_val = 0.0
+                    for cy, cx in self._candidates(coarse, threshold - self.COARSE_MARGIN):
+                        y0 = max(0, cy * scale - pad)
+                        y1 = min(screen_h - tmpl_h + 1, cy * scale + pad + 1)
+                        x0 = max(0, cx * scale - pad)
+                        x1 = min(screen_w - tmpl_w + 1, cx * scale + pad + 1)
+                        if y0 >= y1 or x0 >= x1:
+                            continue
+                        crop = screen[y0:y1 + tmpl_h - 1, x0:x1 + tmpl_w - 1]
+                        val = self.engine._map_score(self.engine._match_one(crop, tmpl, mask))
+                        if val > max_val:
+                            max_val = val
+
+                if max_val > max_score_found:
+                    max_score_found = max_val
+
+                if stop_at is not None and max_val >= stop_at:
+                    self.engine._promote(bank, i)
+                    break
+
+            except Exception:
+                continue
+
+        return max_score_found, all_skipped
+
+    def score_bank(self, screen, bank, threshold, key=None, stop_at=None):
+        """返回 (最高得分, 是否全部模板尺寸不符)；stop_at 见 VisionEngine._score_full"""
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = {"calls": 0, "pyr_ms": None, "full_ms": None, "speedup": None, "checks": 0, "disagree": 0}
+            self.stats[key] = stats
+
+        t0 = time.perf_counter()
+        max_score_found, all_skipped = self._score_pyramid(screen, bank, threshold, stop_at)
+        pyr_ms = (time.perf_counter() - t0) * 1000
+
+        # 提前结束的调用耗时没有可比性，不计入加速比统计
+        early = stop_at is not None and max_score_found >= stop_at
+        if not early:
+            stats["pyr_ms"] = self._ema(stats["pyr_ms"], pyr_ms)
+
+        if stats["calls"] % self.CALIBRATE_EVERY == 0 and not all_skipped and not early:
+            t0 = time.perf_counter()
+            full_score, _, _ = self.engine._score_full(screen, bank)
+            stats["full_ms"] = self._ema(stats["full_ms"], (time.perf_counter() - t0) * 1000)
+            # 粗匹配漏掉真正峰值时，两种模式的阈值判定会不一致（状态栏显示不一致次数）
+            stats["checks"] += 1
+            if (full_score >= threshold) != (max_score_found >= threshold):
+                stats["disagree"] += 1
+        stats["calls"] += 1
+
+        if stats["full_ms"] and stats["pyr_ms"]:
+            stats["speedup"] = stats["full_ms"] / stats["pyr_ms"]
+
+        return max_score_found, all_skipped
+
+    def _ema(self, old, new):
+        if old is None:
+            return new
+        return old + self.EMA_ALPHA * (new - old)
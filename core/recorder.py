@@ -0,0 +1,238 @@
+import itertools
+import json
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+from datetime import datetime
+from core.frame_source import FrameSource, to_bgra
+
+
+MAGIC = b"EVEREC01"
+# 记录头：类型、key 长度、高、宽、通道数、帧序号、时间戳（墙钟秒）、数据长度
+RECORD = struct.Struct("<BHHHBIdI")
+SESSION, KEYFRAME, DELTA, SAME, RESULT = range(5)
+
+
+class SessionRecorder:
+    """
+    会话录像（可选）：把每次匹配用到的区域画面和当时的得分追加写入一个文件，用于事后排查误报 / 漏报。
+    - 每个区域每隔 keyframe_interval 个变化帧存一张完整画面（zlib），中间只存与上一帧的异或差分，
+      画面没变的帧只写一个记录头；相邻帧几乎相同，8 小时的会话通常只有几 MB 到几十 MB
+    - 只追加写：程序中途崩溃也只会丢最后一条不完整的记录
+    - 编码和写盘都在后台线程，监控线程只把这一帧的数组引用放进队列；队列满时丢弃并计数，不阻塞监控
+    """
+
+    def __init__(self, path, keyframe_interval=120, level=1, max_pending=64):
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.level = level
+        self.frames = 0
+        self.dropped = 0
+        self.bytes_written = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._prev = {}
+        self._since_key = {}
+        # perf_counter 时间戳 -> 墙钟时间
+        self._clock_offset = time.time() - time.perf_counter()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+            self.bytes_written += len(MAGIC)
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def for_session(cls, folder, **kwargs):
+        """在 folder 下按开始时间新建一个录像文件"""
+        name = datetime.now().strftime("%Y%m%d_%H%M%S") + ".everec"
+        return cls(os.path.join(folder, name), **kwargs)
+
+    def start_session(self, info):
+        """写入会话信息（配置、区域等），回放时可以读到"""
+        self._put((SESSION, info))
+
+    def record(self, frame, results, sound=None):
+        """监控线程调用：frame 为这次匹配的 Frame，results 为 {区域: (错误, 得分)}"""
+        self._put((RESULT, frame, results, sound))
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+
+    def _write(self, kind, key, shape, seq, timestamp, payload=b""):
+        key = key.encode("utf-8")
+        h, w, c = shape
+        self._file.write(RECORD.pack(kind, len(key), h, w, c, seq, timestamp, len(payload)))
+        self._file.write(key)
+        self._file.write(payload)
+        self.bytes_written += RECORD.size + len(key) + len(payload)
+
+    def _encode(self, key, img, seq, timestamp):
+        # 透明通道没有信息，只存 BGR
+        if img.ndim == 3 and img.shape[2] == 4:
+            img = img[:, :, :3]
+        img = np.ascontiguousarray(img)
+        shape = img.shape if img.ndim == 3 else img.shape + (1,)
+        prev = self._prev.get(key)
+        since = self._since_key.get(key, 0)
+        if prev is not None and prev.shape == img.shape and np.array_equal(prev, img):
+            # 没变化的帧不计入关键帧间隔：静止的画面不需要反复存完整画面
+            self._write(SAME, key, shape, seq, timestamp)
+        elif prev is None or prev.shape != img.shape or since >= self.keyframe_interval:
+            self._write(KEYFRAME, key, shape, seq, timestamp, zlib.compress(img.data, self.level))
+            self._since_key[key] = 0
+        else:
+            self._write(DELTA, key, shape, seq, timestamp, zlib.compress(np.bitwise_xor(prev, img).data, self.level))
+            self._since_key[key] = since + 1
+        self._prev[key] = img
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                if item[0] == SESSION:
+                    payload = json.dumps(item[1], ensure_ascii=False, default=str).encode("utf-8")
+                    self._write(SESSION, "", (0, 0, 0), 0, time.time(), payload)
+                else:
+                    _, frame, results, sound = item
+                    timestamp = frame.timestamp + self._clock_offset
+                    for key, img in frame.images.items():
+                        if img is not None:
+                            self._encode(key, img, frame.seq, timestamp)
+                    payload = json.dumps({"results": {k: [err, float(score)] for k, (err, score) in results.items()},
+                                          "sound": sound}, ensure_ascii=False).encode("utf-8")
+                    self._write(RESULT, "", (0, 0, 0), frame.seq, timestamp, payload)
+                    self.frames += 1
+                self._file.flush()
+            except (OSError, ValueError):
+                # 磁盘写满等情况：放弃这一条，不影响监控
+                self.dropped += 1
+
+
+class RecordedFrame:
+    def __init__(self, seq, timestamp, images, results, sound):
+        self.seq = seq
+        self.timestamp = timestamp
+        # {区域: BGR 数组}，只包含这一帧实际截到（当时到期）的区域
+        self.images = images
+        # 当时的匹配结果 {区域: [错误, 得分]} 和报警音效（没有报警为 None）
+        self.results = results
+        self.sound = sound
+
+
+def read_recording(path):
+    """
+    逐帧读取录像，返回 (会话信息, 帧迭代器)。文件末尾不完整的记录（录制中崩溃）直接忽略。
+    迭代器里的数组是还原后的独立副本，可以保留。
+    """
+    f = open(path, "rb")
+    if f.read(len(MAGIC)) != MAGIC:
+        f.close()
+        raise ValueError(f"不是录像文件: {path}")
+
+    def records():
+        while True:
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                return
+            kind, key_len, h, w, c, seq, timestamp, size = RECORD.unpack(head)
+            key = f.read(key_len).decode("utf-8")
+            payload = f.read(size)
+            if len(payload) < size:
+                return
+            yield kind, key, (h, w, c), seq, timestamp, payload
+
+    session = {}
+    it = records()
+    first = next(it, None)
+    if first is not None and first[0] == SESSION:
+        session = json.loads(first[5].decode("utf-8"))
+        first = None
+
+    def frames():
+        prev = {}
+        images = {}
+        try:
+            for kind, key, shape, seq, timestamp, payload in itertools.chain([first] if first else [], it):
+                if kind == RESULT:
+                    meta = json.loads(payload.decode("utf-8"))
+                    yield RecordedFrame(seq, timestamp, images, meta.get("results", {}), meta.get("sound"))
+                    images = {}
+                    continue
+                if kind == SESSION:
+                    continue
+                h, w, c = shape
+                full = (h, w, c) if c > 1 else (h, w)
+                if kind == KEYFRAME:
+                    img = np.frombuffer(zlib.decompress(payload), np.uint8).reshape(full)
+                elif kind == DELTA:
+                    img = np.bitwise_xor(prev[key], np.frombuffer(zlib.decompress(payload), np.uint8).reshape(full))
+                else:
+                    img = prev[key]
+                prev[key] = img
+                images[key] = img
+        except (zlib.error, KeyError, ValueError):
+            # 损坏的记录之后的内容无法还原
+            return
+        finally:
+            f.close()
+
+    return session, frames()
+
+
+class RecordingSource(FrameSource):
+    """
+    把录像当作画面来源（见 core/frame_source.py），可以让完整的监控流程（AlarmWorker / 无界面模式）跑在录像上：
+    grab_regions 每调用一次前进一帧，按区域名取画面；这一帧里没有的区域沿用该区域最近一次的画面。
+    """
+
+    def __init__(self, path, loop=False):
+        super().__init__()
+        self.path = path
+        self.loop = loop
+        self.session, self._frames = read_recording(path)
+        self.index = -1
+        self.last_frame = None
+        self._latest = {}
+        self._lock = threading.Lock()
+
+    def _next(self):
+        frame = next(self._frames, None)
+        if frame is None and self.loop:
+            self.session, self._frames = read_recording(self.path)
+            frame = next(self._frames, None)
+        return frame
+
+    def grab(self, region):
+        _, _, w, h = self._to_rect(region)
+        with self._lock:
+            for img in self._latest.values():
+                if img.shape[:2] == (h, w):
+                    return to_bgra(img)
+        return None
+
+    def grab_regions(self, regions):
+        with self._lock:
+            frame = self._next()
+            if frame is not None:
+                self.index += 1
+                self.last_frame = frame
+                self._latest.update(frame.images)
+            images = {k: (to_bgra(self._latest[k]) if r and k in self._latest else None) for k, r in regions.items()}
+        self.last_grab_time = time.monotonic()
+        self.last_grab_mode = f"录像 #{self.index + 1}" + ("" if frame is not None else " 已结束")
+        return images
@@ -0,0 +1,96 @@
+class Region:
+    """
+    一个监控区域：截图范围、使用的模板库、阈值、优先级、报警音效、所属客户端、目标截图间隔
+    options 里可以放该区域单独的匹配参数（mode / color_gate / list_layout / preprocess），优先于全局配置
+    """
+
+    def __init__(self, key, rect, bank, threshold=0.95, priority=0, sound=None, client="main",
+                 label=None, options=None, interval=None):
+        self.key = key
+        self.rect = rect
+        self.bank = bank
+        self.threshold = threshold
+        self.priority = priority
+        self.sound = sound or bank
+        self.client = client
+        self.label = label or key
+        self.options = options or {}
+        # 目标截图间隔（秒），None 表示用全局间隔
+        self.interval = interval
+
+
+# 内置的三个区域：(key, 状态栏简称, 优先级)。优先级与原来的报警逻辑一致：总览 > 本地 > 怪物
+BUILTIN_REGIONS = (("overview", "O", 3), ("local", "L", 2), ("monster", "M", 1))
+BUILTIN_ORDER = ("local", "overview", "monster")
+# 这个音效和其他音效同时命中时播放 mixed（原来的“敌对 + 刷怪”混合报警）
+MIXED_WITH = "monster"
+
+
+def load_regions(cfg, require_rect=True):
+    """
+    从配置生成区域列表：内置的 local / overview / monster（客户端 main），
+    再加上 extra_regions 里的额外区域（多开客户端）。没有截图范围的区域不参与监控
+    （require_rect=False 时保留，回放录像时截图范围取自录像）
+    """
+    regions = []
+    rects = cfg.get("regions") or {}
+    thresholds = cfg.get("thresholds") or {}
+    intervals = cfg.get("region_intervals") or {}
+    builtin = {key: (label, priority) for key, label, priority in BUILTIN_REGIONS}
+    for key in BUILTIN_ORDER:
+        label, priority = builtin[key]
+        regions.append(Region(key, rects.get(key), key, thresholds.get(key, 0.95), priority,
+                              sound=key, client="main", label=label, interval=intervals.get(key)))
+
+    seen = {r.key for r in regions}
+    for entry in cfg.get("extra_regions") or []:
+        region = region_from_entry(entry, thresholds)
+        if region is None or region.key in seen:
+            continue
+        seen.add(region.key)
+        regions.append(region)
+
+    return [r for r in regions if r.rect or not require_rect]
+
+
+def region_from_entry(entry, thresholds=None):
+    """
+    按 extra_regions 的一项生成区域（未给出的字段按 bank 取内置区域的默认值）；
+    缺少 key 时返回 None
+    """
+    thresholds = thresholds or {}
+    builtin = {key: (label, priority) for key, label, priority in BUILTIN_REGIONS}
+    try:
+        key = str(entry["key"])
+        bank = entry.get("bank", "local")
+    except (KeyError, TypeError, AttributeError):
+        return None
+    default_label, default_priority = builtin.get(bank, (key, 0))
+    return Region(
+        key, entry.get("rect"), bank,
+        threshold=entry.get("threshold", thresholds.get(bank, 0.95)),
+        priority=entry.get("priority", default_priority),
+        sound=entry.get("sound", bank if bank in builtin else "local"),
+        client=entry.get("client", key),
+        label=entry.get("label", default_label),
+        options={k: entry[k] for k in ("mode", "color_gate", "list_layout", "preprocess") if k in entry},
+        interval=entry.get("interval"),
+    )
+
+
+def has_threat_region(regions):
+    """至少设置了一个非怪物区域（内置 local / overview，或额外区域）才能开始监控"""
+    return any(r.bank != "monster" for r in regions)
+
+
+def choose_sound(hits):
+    """
+    命中区域 -> 要播放的音效：
+    MIXED_WITH 音效和其他音效同时命中时播放 mixed，否则播放优先级最高的命中区域的音效
+    """
+    if not hits:
+        return None
+    sounds = {r.sound for r in hits}
+    if MIXED_WITH in sounds and len(sounds) > 1:
+        return "mixed"
+    return max(hits, key=lambda r: r.priority).sound
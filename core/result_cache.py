@@ -0,0 +1,61 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    按画面内容寻址的匹配结果缓存（LRU）：
+    本地栏、总览经常在几种固定画面之间来回切换（空、常见的军团成员、某个熟悉的中立），
+    画面回到见过的状态时直接取出当时的得分，不再预处理和匹配。
+    键是灰度图内容的哈希 + 预处理参数 + 匹配方式；值里保存模板库对象本身，模板库换了就不算命中。
+    与变化检测（只和上一帧比较）互补：几分钟后才回来的画面也能命中。
+    """
+
+    def __init__(self, size=64):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @staticmethod
+    def key_of(gray, *params):
+        """灰度图内容（含尺寸）的 128 位哈希，加上影响结果的参数"""
+        digest = hashlib.blake2b(gray.data if gray.flags.c_contiguous else gray.tobytes(), digest_size=16)
+        return (digest.digest(), gray.shape) + params
+
+    def get(self, key, bank, threshold):
+        """命中返回 (得分, 是否全部跳过)，否则 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            # 非精确得分（提前结束 / 命中追踪）只能证明达到了当时的阈值
+            if entry is not None and entry[0] is bank and (entry[3] or entry[1] >= threshold):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], entry[2]
+            self.misses += 1
+            return None
+
+    def put(self, key, bank, score, all_skipped, exact=True):
+        if self.size <= 0:
+            return
+        with self._lock:
+            old = self._entries.get(key)
+            # 已有精确结果时不用非精确结果覆盖
+            if old is not None and old[0] is bank and old[3] and not exact:
+                return
+            self._entries[key] = (bank, score, all_skipped, exact)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,61 @@
+class HitTracker:
+    """
+    命中位置追踪：
+    敌对图标出现后通常会在同一行停留很多帧。记住每个区域最近一次命中的模板和位置，
+    下一帧先只在该位置附近的小窗口里复核这个模板，达到阈值就直接判定命中；
+    复核失败、或连续追踪 FULL_SCAN_EVERY 次之后，回到全量扫描。
+    """
+
+    # 复核窗口在命中位置四周外扩的像素
+    MARGIN = 4
+    # 连续追踪这么多次后强制全量扫描一次
+    FULL_SCAN_EVERY = 10
+
+    def __init__(self):
+        self.hits = {}
+
+    def clear(self):
+        self.hits.clear()
+
+    def forget(self, key):
+        self.hits.pop(key, None)
+
+    def record(self, key, bank, index, loc, shape):
+        """loc: minMaxLoc 给出的 (x, y)"""
+        self.hits[key] = {"bank": bank, "index": index, "loc": loc, "shape": shape, "streak": 0}
+
+    def check(self, engine, key, screen, bank, threshold):
+        """在上次命中位置附近复核，命中返回得分，否则返回 None（需要全量扫描）"""
+        hit = self.hits.get(key)
+        if hit is None:
+            return None
+        if hit["bank"] is not bank or hit["index"] >= len(bank) or hit["shape"] != screen.shape:
+            self.forget(key)
+            return None
+        if hit["streak"] >= self.FULL_SCAN_EVERY:
+            return None
+
+        tmpl, mask = bank[hit["index"]]
+        tmpl_h, tmpl_w = tmpl.shape[:2]
+        x, y = hit["loc"]
+        y0 = max(0, y - self.MARGIN)
+        y1 = min(screen.shape[0] - tmpl_h, y + self.MARGIN)
+        x0 = max(0, x - self.MARGIN)
+        x1 = min(screen.shape[1] - tmpl_w, x + self.MARGIN)
+        if y0 > y1 or x0 > x1:
+            self.forget(key)
+            return None
+
+        try:
+            res = engine._match_one(screen[y0:y1 + tmpl_h, x0:x1 + tmpl_w], tmpl, mask)
+            val, loc = engine._map_peak(res)
+        except Exception:
+            val, loc = 0.0, None
+
+        if loc is None or val < threshold:
+            self.forget(key)
+            return None
+
+        hit["loc"] = (x0 + loc[0], y0 + loc[1])
+        hit["streak"] += 1
+        return val
@@ -0,0 +1,127 @@
+import statistics
+import threading
+import time
+from collections import deque
+
+
+class TickScheduler:
+    """
+    自适应截图调度（替代固定 sleep）：
+    - 每个区域有自己的目标间隔，到期时间按“上次到期 + 间隔”推进，处理耗时自动扣除，节奏不会漂移
+    - 区域“热”（命中，或最近 hot_hold 秒内命中过）时按 hot_interval 加快
+    - 画面连续 idle_after 次没有变化（复用 / 缓存命中）时按 idle_interval 放慢
+    - CPU 预算：最近一段时间匹配耗时占墙钟时间的比例超过 cpu_budget 时，所有间隔按比例拉长
+    同时统计实际的匹配频率、匹配间隔的抖动（标准差）和截图相对到期时间的平均延后。
+    """
+
+    BUSY_WINDOW = 5.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.settings = {"interval": 0.5, "hot_interval": 0.2, "idle_interval": 1.5,
+                         "idle_after": 10, "hot_hold": 10.0, "cpu_budget": 0.5}
+        self.states = {}
+        self._busy = deque()
+        self._ticks = deque(maxlen=50)
+        self._lateness = deque(maxlen=50)
+
+    def configure(self, regions, settings=None):
+        """regions: Region 列表（Region.interval 为 None 时用全局间隔）；settings 覆盖默认调度参数"""
+        with self._lock:
+            if settings:
+                self.settings.update({k: v for k, v in settings.items() if v is not None})
+            now = time.perf_counter()
+            keys = set()
+            for r in regions:
+                keys.add(r.key)
+                state = self.states.get(r.key)
+                if state is None:
+                    state = {"next_due": now, "last_hit": None, "unchanged": 0, "interval": None}
+                    self.states[r.key] = state
+                state["base"] = r.interval or self.settings["interval"]
+            for key in [k for k in self.states if k not in keys]:
+                del self.states[key]
+
+    def _budget_scale(self, now):
+        while self._busy and self._busy[0][0] < now - self.BUSY_WINDOW:
+            self._busy.popleft()
+        ratio = sum(b for _, b in self._busy) / self.BUSY_WINDOW
+        budget = self.settings["cpu_budget"]
+        return max(1.0, ratio / budget) if budget else 1.0
+
+    def _interval(self, state, now):
+        s = self.settings
+        if state["last_hit"] is not None and now - state["last_hit"] < s["hot_hold"]:
+            interval = min(state["base"], s["hot_interval"])
+        elif state["unchanged"] >= s["idle_after"]:
+            interval = max(state["base"], s["idle_interval"])
+        else:
+            interval = state["base"]
+        return interval * self._budget_scale(now)
+
+    def due(self, now=None):
+        """返回到期的区域 key 集合，并推进它们的下次到期时间"""
+        now = time.perf_counter() if now is None else now
+        due = set()
+        with self._lock:
+            for key, state in self.states.items():
+                if state["next_due"] > now:
+                    continue
+                due.add(key)
+                self._lateness.append(now - state["next_due"])
+                interval = self._interval(state, now)
+                state["interval"] = interval
+                state["next_due"] += interval
+                if state["next_due"] <= now:
+                    # 落后超过一个间隔（例如刚从休眠恢复）就重新对齐，不补做错过的截图
+                    state["next_due"] = now + interval
+        return due
+
+    def next_wake(self):
+        with self._lock:
+            if not self.states:
+                return time.perf_counter() + self.settings["interval"]
+            return min(state["next_due"] for state in self.states.values())
+
+    def report(self, key, hit, unchanged, now=None):
+        """匹配完一个区域后调用：命中则变热，画面未变化则累计空闲次数"""
+        now = time.perf_counter() if now is None else now
+        with self._lock:
+            state = self.states.get(key)
+            if state is None:
+                return
+            if hit:
+                became_hot = state["last_hit"] is None or now - state["last_hit"] >= self.settings["hot_hold"]
+                state["last_hit"] = now
+                if became_hot:
+                    # 刚变热的区域立即按热间隔重新排期，不等原来的慢间隔
+                    state["next_due"] = min(state["next_due"], now + self.settings["hot_interval"])
+            state["unchanged"] = state["unchanged"] + 1 if unchanged else 0
+
+    def tick_done(self, busy, now=None):
+        """一次匹配结束：busy 为本次匹配耗时（秒）"""
+        now = time.perf_counter() if now is None else now
+        with self._lock:
+            self._busy.append((now, busy))
+            self._ticks.append(now)
+
+    def hz(self):
+        with self._lock:
+            if len(self._ticks) < 2 or self._ticks[-1] == self._ticks[0]:
+                return 0.0
+            return (len(self._ticks) - 1) / (self._ticks[-1] - self._ticks[0])
+
+    def jitter_ms(self):
+        """最近相邻两次匹配间隔的标准差（毫秒）"""
+        with self._lock:
+            if len(self._ticks) < 3:
+                return 0.0
+            ticks = list(self._ticks)
+        return statistics.pstdev(b - a for a, b in zip(ticks, ticks[1:])) * 1000
+
+    def lateness_ms(self):
+        """最近截图相对到期时间的平均延后（毫秒）"""
+        with self._lock:
+            if not self._lateness:
+                return 0.0
+            return sum(self._lateness) / len(self._lateness) * 1000
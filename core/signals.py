@@ -0,0 +1,29 @@
+import threading
+
+
+class Signal:
+    """
+    不依赖 Qt 的最小信号：connect / disconnect / emit。
+    槽函数在发出信号的线程里直接调用；GUI 需要回到主线程时，把 emit 接到一个 pyqtSignal 上转发即可。
+    """
+
+    def __init__(self):
+        self._slots = []
+        self._lock = threading.Lock()
+
+    def connect(self, slot):
+        with self._lock:
+            self._slots.append(slot)
+
+    def disconnect(self, slot=None):
+        with self._lock:
+            if slot is None:
+                self._slots.clear()
+            elif slot in self._slots:
+                self._slots.remove(slot)
+
+    def emit(self, *args):
+        with self._lock:
+            slots = list(self._slots)
+        for slot in slots:
+            slot(*args)
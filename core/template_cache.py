@@ -0,0 +1,145 @@
+import json
+import os
+import tempfile
+import threading
+import numpy as np
+
+
+class TemplateCache:
+    """
+    预处理后模板的磁盘缓存（单个文件，可内存映射）：
+    文件头 + JSON 索引 + 数据区（uint8 数组，每个按 64 字节对齐）。
+    每个模板按 (源文件绝对路径, 预处理参数) 索引，同一个文件夹按不同参数处理的几份互不覆盖；
+    记录 mtime、大小和预处理参数，三者都一致才算命中。
+    只有变化的文件需要重新读图和预处理，写回时整体重写一次（先写到本进程独有的临时文件，
+    匹配子进程同时写回也不会互相覆盖半截文件）。
+    读取时把文件映射进来，命中的数组复制出来后立即释放映射，
+    这样重写缓存文件时（Windows 下）不会因为文件仍被映射而失败。
+    """
+
+    MAGIC = b"EVETPL02"
+    ALIGN = 64
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        # 热更新会在后台线程读写缓存
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as f:
+                if f.read(len(self.MAGIC)) != self.MAGIC:
+                    return
+                index_len = int(np.frombuffer(f.read(8), np.uint64)[0])
+                index = json.loads(f.read(index_len).decode("utf-8"))
+            if not index:
+                return
+            data = np.memmap(self.path, dtype=np.uint8, mode="r", offset=self._data_start(index_len))
+            try:
+                for meta in index:
+                    arrays = {}
+                    for name, (offset, shape) in meta["arrays"].items():
+                        size = int(np.prod(shape))
+                        arrays[name] = np.array(data[offset:offset + size]).reshape(shape)
+                    self.entries[(meta["src"], meta["params"])] = (meta["stamp"], arrays)
+            finally:
+                del data
+        except Exception as e:
+            # 缓存损坏就当作没有缓存，下次写回时重建
+            print(f"模板缓存读取失败，将重建: {e}")
+            self.entries.clear()
+            self.dirty = True
+
+    def _data_start(self, index_len):
+        """数据区起点：文件头和索引之后按 ALIGN 对齐；索引里的偏移都相对数据区"""
+        header_len = len(self.MAGIC) + 8 + index_len
+        return -(-header_len // self.ALIGN) * self.ALIGN
+
+    @staticmethod
+    def _stamp(path, params):
+        st = os.stat(path)
+        return [st.st_mtime_ns, st.st_size, params]
+
+    def get(self, path, params):
+        """命中返回 {名字: 数组}，否则返回 None"""
+        with self._lock:
+            entry = self.entries.get((os.path.abspath(path), params))
+            try:
+                if entry is not None and entry[0] == self._stamp(path, params):
+                    self.hits += 1
+                    return entry[1]
+            except OSError:
+                pass
+            self.misses += 1
+            return None
+
+    def put(self, path, params, arrays):
+        try:
+            stamp = self._stamp(path, params)
+        except OSError:
+            return
+        with self._lock:
+            self.entries[(os.path.abspath(path), params)] = (stamp, {k: np.ascontiguousarray(v) for k, v in arrays.items()})
+            self.dirty = True
+
+    def clear(self):
+        """清空内存中的条目（缓存文件不动，下次 flush 时整体重写）"""
+        with self._lock:
+            self.entries.clear()
+            self.dirty = True
+
+    def flush(self):
+        """有变化时写回：去掉源文件已删除的条目，先写临时文件再替换"""
+        with self._lock:
+            self._write()
+
+    def _write(self):
+        for key in [k for k in self.entries if not os.path.exists(k[0])]:
+            del self.entries[key]
+            self.dirty = True
+        if not self.dirty:
+            return
+
+        index = []
+        blobs = []
+        offset = 0
+        for (src, params), (stamp, arrays) in self.entries.items():
+            meta = {"src": src, "params": params, "stamp": stamp, "arrays": {}}
+            for name, arr in arrays.items():
+                meta["arrays"][name] = [offset, list(arr.shape)]
+                blobs.append((offset, arr))
+                offset += -(-arr.nbytes // self.ALIGN) * self.ALIGN
+            index.append(meta)
+
+        index_bytes = json.dumps(index).encode("utf-8")
+        data_start = self._data_start(len(index_bytes))
+
+        tmp = None
+        try:
+            folder = os.path.dirname(self.path) or "."
+            os.makedirs(folder, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=folder, prefix=os.path.basename(self.path) + ".", suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.MAGIC)
+                f.write(np.uint64(len(index_bytes)).tobytes())
+                f.write(index_bytes)
+                for rel, arr in blobs:
+                    f.seek(data_start + rel)
+                    f.write(arr.tobytes())
+            os.replace(tmp, self.path)
+            self.dirty = False
+        except OSError as e:
+            # 写不进去只影响下次启动的速度，不影响匹配
+            print(f"模板缓存写入失败: {e}")
+            if tmp is not None and os.path.exists(tmp):
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
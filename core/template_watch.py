@@ -0,0 +1,73 @@
+import os
+import threading
+import time
+
+
+class TemplateWatcher:
+    """
+    模板文件夹热更新（轮询）：
+    后台线程定期检查每个模板库文件夹里图片的 mtime / 大小，有增删改时在后台重新加载该库
+    （未变化的文件直接命中模板缓存，只有变化的文件需要重新处理），结果先暂存；
+    监控线程在两次匹配之间调用 apply()，一次性换上新的模板库，匹配过程中模板库不会变化。
+    """
+
+    EXTENSIONS = ('.png', '.jpg', '.bmp')
+
+    def __init__(self, vision, interval=2.0):
+        self.vision = vision
+        self.interval = interval
+        self.running = False
+        self.thread = None
+        self._snapshots = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._snapshots = {name: self._snapshot(folder) for name, folder in self.vision.bank_folders.items()}
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def _snapshot(self, folder):
+        files = {}
+        try:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    if entry.name.lower().endswith(self.EXTENSIONS):
+                        st = entry.stat()
+                        files[entry.name] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            pass
+        return files
+
+    def _loop(self):
+        while self.running:
+            time.sleep(self.interval)
+            for name, folder in list(self.vision.bank_folders.items()):
+                snapshot = self._snapshot(folder)
+                old = self._snapshots.get(name)
+                self._snapshots[name] = snapshot
+                if old is None or snapshot == old:
+                    continue
+                bank = self.vision.load_bank_files(folder, self.vision.bank_params.get(name))
+                with self._lock:
+                    self._pending[name] = bank
+
+    def apply(self):
+        """在两次匹配之间调用：换上后台准备好的模板库，返回 {库名: (原数量, 新数量)}"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        changes = {}
+        for name, bank in pending.items():
+            old = self.vision.banks.get(name)
+            self.vision.replace_bank(name, bank)
+            changes[name] = (len(old) if old is not None else 0, len(bank))
+        return changes
@@ -1,21 +1,103 @@
 import cv2
 import numpy as np
-import mss
 import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from core.capture import CaptureManager
+from core.change_detect import RegionChangeTracker
+from core.pyramid import PyramidMatcher
+from core.fft_match import FFTBankMatcher
+from core.masked_ncc import MaskedNCC
+from core.roi import HitTracker
+from core.list_mode import ListScanner
+from core.color_gate import ColorGate
+from core.template_cache import TemplateCache
+from core.result_cache import ResultCache
+from core.metrics import metrics
 
 class VisionEngine:
     def __init__(self):
         self.local_templates = []
         self.overview_templates = []
         self.monster_templates = []
+        # 模板库名 -> 模板列表：内置三个库，以及额外区域按文件夹路径懒加载的库
+        self.banks = {}
+        # 模板库名 -> 文件夹 / 预处理参数（模板热更新按这个监视和重新加载）
+        self.bank_folders = {}
+        self.bank_params = {}
+        # 模板数组 id -> 文件名（分阶段耗时统计按模板记录时用）
+        self.template_names = {}
         
         self.template_status_msg = "初始化中..."
         self.last_screenshot_shape = "无"
         self.last_error = None
         
+        # 预处理参数（见 preprocess_image）
+        self.gamma = 1.5
+        self.cutoff = 30
         # 初始化 CLAHE
         # clipLimit 稍微调低一点 (2.0 -> 1.5)，防止过度放大噪声
-        self.clahe = cv2.createCLAHE(clipLimit=1.5, tileGridSize=(8,8))
+        self.clahe_clip = 1.5
+        self.clahe_tile = 8
+        # CLAHE 对象内部有缓冲区，不能多个线程共用：每个线程一个
+        self._local = threading.local()
+        # Gamma + 阈值截断合成的查找表，按 (gamma, cutoff) 缓存
+        self._tone_luts = {}
+        # 每个区域上一次各阶段耗时（毫秒）：灰度转换 / 预处理 / 匹配
+        self.stage_ms = {}
+
+        # 预处理后模板的磁盘缓存，第一次加载模板库时打开
+        self.template_cache = None
+
+        # 按区域预分配的灰度图 / 预处理缓冲，跨帧复用，长时间运行不反复申请内存
+        self._buffers = {}
+
+        # 长期截图会话（每线程一个），支持多区域一次截图
+        self.capture = CaptureManager()
+
+        # 变化检测：按区域保存上一帧状态，画面未变时复用得分
+        self.change_detection = True
+        self.change_tile = 32
+        self.trackers = {}
+        self.last_match_mode = {}
+        self.change_stats = {"reuse": 0, "cached": 0, "partial": 0, "roi": 0, "gated": 0, "full": 0}
+
+        # 按画面内容缓存的匹配结果（LRU），画面回到见过的状态时直接取结果；大小为 0 表示关闭
+        self.result_cache = ResultCache(size=64)
+
+        # 金字塔匹配（按区域可选）
+        self.pyramid = PyramidMatcher(self)
+        # 整库批量 FFT 匹配（按区域可选）
+        self.fft = FFTBankMatcher(self)
+
+        # 带透明通道模板的匹配后端："ncc" 积分图快速实现 / "opencv" cv2.matchTemplate 掩码路径
+        self.masked_backend = "ncc"
+        self.masked_ncc = MaskedNCC()
+
+        # 提前结束：按模板库记录命中顺序，以及每个区域上次实际匹配了几个模板
+        self.hit_orders = {}
+        # 多个匹配线程会同时调整同一个模板库的命中顺序
+        self._order_lock = threading.Lock()
+        self.last_evaluated = {}
+
+        # 命中位置追踪：下一帧先在上次命中位置附近复核
+        self.roi = HitTracker()
+
+        # 列表模式：本地栏按行扫描，记录每个区域上次命中的行数
+        self.list_scanner = ListScanner(self)
+        self.last_row_hits = {}
+
+        # 颜色预筛选：模板库加载时学习颜色表，记录每个区域上次的候选框数量
+        self.color_gate = ColorGate()
+        self.last_candidates = {}
+
+        # 并行匹配：区域之间、大模板库的模板之间分给线程池（OpenCV 匹配时会释放 GIL）
+        # 线程数有上限，给游戏客户端留出 CPU
+        self.match_threads = 1
+        self._pool = None
+        self._pool_size = 0
+        self._stats_lock = threading.Lock()
             
         self.load_templates()
 
@@ -25,19 +107,81 @@ class VisionEngine:
         path_overview = os.path.join(base_dir, "assets", "hostile_icons_overview")
         path_monster = os.path.join(base_dir, "assets", "monster_icons")
         
+        # 颜色表在加载模板时学习，必须先清空
+        self.color_gate.clear()
+        self.template_names.clear()
+        if self.template_cache is None:
+            self.template_cache = TemplateCache(os.path.join(base_dir, ".cache", "templates.bin"))
+        self.template_cache.hits = self.template_cache.misses = 0
         self.local_templates = self._load_images_from_folder(path_local)
         self.overview_templates = self._load_images_from_folder(path_overview)
         self.monster_templates = self._load_images_from_folder(path_monster)
+        self.banks = {
+            "local": self.local_templates,
+            "overview": self.overview_templates,
+            "monster": self.monster_templates,
+        }
+        self.bank_folders = {"local": path_local, "overview": path_overview, "monster": path_monster}
+        self.bank_params = {}
+        self.template_cache.flush()
+        self.trackers.clear()
+        self.pyramid.clear()
+        self.fft.clear()
+        self.masked_ncc.clear()
+        self.hit_orders.clear()
+        self.roi.clear()
+        self.list_scanner.clear()
+        self.result_cache.clear()
         
         self.template_status_msg = (
             f"路径: {base_dir}\n"
             f"本地图标: {len(self.local_templates)} 张\n"
             f"总览图标: {len(self.overview_templates)} 张\n"
-            f"怪物图标: {len(self.monster_templates)} 张"
+            f"怪物图标: {len(self.monster_templates)} 张\n"
+            f"模板缓存: 命中 {self.template_cache.hits} 张, 重新处理 {self.template_cache.misses} 张"
         )
 
-    def _load_images_from_folder(self, folder):
+    def get_bank(self, name, preprocess=None):
+        """
+        按名字取模板库；不是内置库名时当作文件夹路径（相对工作目录）加载并缓存
+        preprocess: 区域单独的预处理参数，与全局参数不同时模板也要按这套参数另外处理一份
+        """
+        params = self.preprocess_params(preprocess)
+        bank_key = name if params == self.preprocess_params() else f"{name}@{self.preprocess_key(params)}"
+        bank = self.banks.get(bank_key)
+        if bank is None:
+            folder = self.bank_folders.get(name) or os.path.join(os.getcwd(), name)
+            bank = self.load_bank_files(folder, params)
+            self.banks[bank_key] = bank
+            self.bank_folders[bank_key] = folder
+            self.bank_params[bank_key] = params
+        return bank
+
+    def load_bank_files(self, folder, params=None):
+        """加载一个模板文件夹（走模板缓存，只处理变化过的文件）并写回缓存"""
+        bank = self._load_images_from_folder(folder, params)
+        if self.template_cache is not None:
+            self.template_cache.flush()
+        return bank
+
+    def replace_bank(self, name, bank):
+        """换上新的模板库（热更新），丢掉旧库的按库缓存；按区域保存的状态因模板库对象不同会自动失效"""
+        old = self.banks.get(name)
+        self.banks[name] = bank
+        if name == "local":
+            self.local_templates = bank
+        elif name == "overview":
+            self.overview_templates = bank
+        elif name == "monster":
+            self.monster_templates = bank
+        if old is not None:
+            for cache in (self.pyramid._prepared, self.hit_orders, self.color_gate._luts):
+                cache.pop(id(old), None)
+            self.fft.forget(old)
+
+    def _load_images_from_folder(self, folder, params=None):
         templates = []
+        color_samples = []
         if not os.path.exists(folder):
             try:
                 os.makedirs(folder)
@@ -48,94 +192,308 @@ class VisionEngine:
         for filename in os.listdir(folder):
             if filename.lower().endswith(('.png', '.jpg', '.bmp')):
                 path = os.path.join(folder, filename)
-                try:
-                    img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
-                    if img is not None:
-                        # 预处理模板：确保模板也经过同样的 Gamma 和 CLAHE 处理
-                        if img.shape[2] == 4:
-                            b, g, r, a = cv2.split(img)
-                            gray = cv2.cvtColor(cv2.merge([b,g,r]), cv2.COLOR_BGR2GRAY)
-                            processed = self.preprocess_image(gray)
-                            templates.append((processed, a))
-                        else:
-                            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-                            processed = self.preprocess_image(gray)
-                            templates.append((processed, None))
-                except:
-                    pass
+                arrays = self._load_template_file(path, params)
+                if arrays is None:
+                    continue
+                templates.append((arrays["processed"], arrays.get("mask")))
+                self.template_names[id(arrays["processed"])] = f"{os.path.basename(folder)}/{filename}"
+                color_samples.append((arrays["bgr"], arrays.get("mask")))
+        self.color_gate.learn(templates, color_samples)
         return templates
 
-    def apply_gamma(self, image, gamma=1.0):
+    def preprocess_params(self, overrides=None):
+        """预处理参数 (gamma, cutoff, clahe_clip, clahe_tile)；overrides 为区域单独设置的部分参数"""
+        overrides = overrides or {}
+        return (float(overrides.get("gamma", self.gamma)), int(overrides.get("cutoff", self.cutoff)),
+                float(overrides.get("clahe_clip", self.clahe_clip)), int(overrides.get("clahe_tile", self.clahe_tile)))
+
+    def preprocess_key(self, params=None):
+        """预处理参数的标识，参数变了模板缓存就失效"""
+        gamma, cutoff, clip, tile = params or self.preprocess_params()
+        return f"gamma={gamma};cutoff={cutoff};clahe={clip}/{tile}"
+
+    def _load_template_file(self, path, params=None):
+        """
+        读取单个模板：{"processed": 预处理后的灰度图, "mask": alpha（没有透明通道时不含）, "bgr": 彩色图}
+        优先从模板缓存取，读取失败返回 None；params 见 preprocess_params
+        """
+        cache = self.template_cache
+        cache_key = self.preprocess_key(params)
+        if cache is not None:
+            arrays = cache.get(path, cache_key)
+            if arrays is not None:
+                return arrays
+        try:
+            img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+            if img is None:
+                return None
+            # 预处理模板：确保模板也经过同样的 Gamma 和 CLAHE 处理
+            if img.shape[2] == 4:
+                b, g, r, a = cv2.split(img)
+                bgr = cv2.merge([b,g,r])
+                gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+                arrays = {"processed": self.preprocess_image(gray, params=params), "mask": a, "bgr": bgr}
+            else:
+                gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+                arrays = {"processed": self.preprocess_image(gray, params=params), "bgr": img}
+        except:
+            return None
+        if cache is not None:
+            cache.put(path, cache_key, arrays)
+        return arrays
+
+    def _clahe(self, clip, tile):
+        """当前线程的 CLAHE 对象（按参数缓存）"""
+        cache = getattr(self._local, "clahe", None)
+        if cache is None:
+            cache = self._local.clahe = {}
+        clahe = cache.get((clip, tile))
+        if clahe is None:
+            clahe = cache[(clip, tile)] = cv2.createCLAHE(clipLimit=clip, tileGridSize=(tile, tile))
+        return clahe
+
+    def _tone_lut(self, gamma, cutoff):
+        """
+        Gamma 校正和阈值截断合成一张查找表（按参数缓存）：
+        先按 gamma 映射，映射后不大于 cutoff 的值置 0（与 THRESH_TOZERO 相同）
+        """
+        table = self._tone_luts.get((gamma, cutoff))
+        if table is None:
+            invGamma = 1.0 / gamma
+            table = (((np.arange(256) / 255.0) ** invGamma) * 255).astype(np.uint8)
+            table[table <= cutoff] = 0
+            self._tone_luts[(gamma, cutoff)] = table
+        return table
+
+    def apply_gamma(self, image, gamma=1.0, dst=None):
         """
         Gamma 校正：
         Gamma > 1.0: 压暗阴影 (消除背景噪声)
         Gamma < 1.0: 提亮阴影
         我们这里使用 Gamma > 1 来压制 EVE 的深色星空背景
         """
-        invGamma = 1.0 / gamma
-        table = np.array([((i / 255.0) ** invGamma) * 255
-            for i in np.arange(0, 256)]).astype("uint8")
-        return cv2.LUT(image, table)
+        return cv2.LUT(image, self._tone_lut(gamma, -1), dst=dst)
 
-    def preprocess_image(self, gray_img):
+    def preprocess_image(self, gray_img, out=None, scratch=None, params=None):
         """
         统一的图像预处理流水线
+        out / scratch: 可选的预分配缓冲（与输入同尺寸的 uint8），给出时不再申请新内存
+        params: 见 preprocess_params，默认使用全局参数
         """
-        # 1. Gamma 校正：压暗背景，突出高亮图标
-        # 1.5 是一个经验值，能有效把深灰色背景压成接近纯黑
-        gamma_corrected = self.apply_gamma(gray_img, gamma=1.5)
-        
-        # 2. 简单的阈值截断：把低于 30 的像素直接置为 0
-        # 这能彻底杀死微弱的星光噪点
-        _, thresholded = cv2.threshold(gamma_corrected, 30, 255, cv2.THRESH_TOZERO)
+        gamma, cutoff, clip, tile = params or self.preprocess_params()
+
+        # 1+2. Gamma 校正 + 阈值截断，合成一次查表：
+        # Gamma 压暗背景，突出高亮图标（1.5 是经验值，能把深灰色背景压成接近纯黑）；
+        # 再把低于 cutoff 的像素置 0，彻底杀死微弱的星光噪点
+        toned = cv2.LUT(gray_img, self._tone_lut(gamma, cutoff), dst=scratch)
         
         # 3. CLAHE 增强：增强剩余有效像素的对比度
-        enhanced = self.clahe.apply(thresholded)
+        enhanced = self._clahe(clip, tile).apply(toned, dst=out)
         
         return enhanced
 
+    def _region_buffers(self, key, shape, keep=None):
+        """
+        区域 key 的预分配缓冲：(灰度图, 中间结果, 预处理结果)
+        预处理结果有两块轮流使用，避开 keep（变化检测保存的上一帧预处理结果）
+        """
+        buf = self._buffers.get(key)
+        if buf is None or buf["shape"] != shape:
+            buf = {"shape": shape, "gray": np.empty(shape, np.uint8), "scratch": np.empty(shape, np.uint8),
+                   "processed": (np.empty(shape, np.uint8), np.empty(shape, np.uint8))}
+            self._buffers[key] = buf
+        first, second = buf["processed"]
+        return buf["gray"], buf["scratch"], (second if keep is first else first)
+
+    def apply_settings(self, settings):
+        """应用引擎级设置：change_detection / masked_backend / match_threads / result_cache_size，缺省的不变"""
+        self.change_detection = bool(settings.get("change_detection", self.change_detection))
+        self.masked_backend = settings.get("masked_backend") or self.masked_backend
+        self.match_threads = settings.get("match_threads") or self.match_threads
+        self.result_cache.size = int(settings.get("result_cache_size", self.result_cache.size))
+
+    def set_source(self, source=None):
+        """换画面来源（见 core/frame_source.py），None 表示实时截图"""
+        self.capture = source or CaptureManager()
+
     def capture_screen(self, region, debug_name=None):
         self.last_error = None
         if not region: 
             return None
         
-        monitor = {"top": int(region[1]), "left": int(region[0]), "width": int(region[2]), "height": int(region[3])}
-        
         try:
-            with mss.mss() as sct:
-                img = np.array(sct.grab(monitor))
-                img_bgr = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
-                
-                h, w = img_bgr.shape[:2]
-                self.last_screenshot_shape = f"{w}x{h}"
-                
-                # 内存返回，不写盘
-                return img_bgr
+            img = self.capture.grab(region)
+            img_bgr = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+            
+            h, w = img_bgr.shape[:2]
+            self.last_screenshot_shape = f"{w}x{h}"
+            
+            # 内存返回，不写盘
+            return img_bgr
                 
         except Exception as e:
             self.last_error = f"截图失败: {str(e)}"
             return None
 
-    def match_templates(self, screen_img, template_list, threshold, return_max_val=False):
-        if screen_img is None:
-            err = self.last_error if self.last_error else "未获取到截图"
-            return (err, 0.0) if return_max_val else False
-            
-        if not template_list:
-            return ("无模板", 0.0) if return_max_val else False
+    def capture_regions(self, regions):
+        """
+        一次截图获取所有区域
+        regions: {名称: 区域 或 None}
+        返回 {名称: BGRA 视图 或 None}，视图零拷贝共享同一帧
+        """
+        self.last_error = None
+        try:
+            frames = self.capture.grab_regions(regions)
+            self.last_screenshot_shape = self.capture.last_grab_mode
+            return frames
+        except Exception as e:
+            self.last_error = f"截图失败: {str(e)}"
+            return {k: None for k in regions}
 
-        screen_h, screen_w = screen_img.shape[:2]
-        
-        # === 步骤 1: 预处理截图 ===
-        screen_gray = cv2.cvtColor(screen_img, cv2.COLOR_BGR2GRAY)
-        
-        # 使用新的流水线：Gamma -> Threshold -> CLAHE
-        screen_processed = self.preprocess_image(screen_gray)
-        
+    def _match_one(self, screen_processed, tmpl_processed, mask):
+        if not metrics.enabled:
+            return self._match_raw(screen_processed, tmpl_processed, mask)
+        t0 = time.perf_counter()
+        res = self._match_raw(screen_processed, tmpl_processed, mask)
+        metrics.record("template/" + self.template_names.get(id(tmpl_processed), "?"),
+                       (time.perf_counter() - t0) * 1000)
+        return res
+
+    def _match_raw(self, screen_processed, tmpl_processed, mask):
+        # 使用 TM_CCOEFF_NORMED
+        if mask is not None:
+            if self.masked_backend == "ncc":
+                return self.masked_ncc.match(screen_processed, tmpl_processed, mask)
+            return cv2.matchTemplate(screen_processed, tmpl_processed, cv2.TM_CCOEFF_NORMED, mask=mask)
+        return cv2.matchTemplate(screen_processed, tmpl_processed, cv2.TM_CCOEFF_NORMED)
+
+    @staticmethod
+    def _map_peak(res):
+        """结果图的最高分和位置 (x, y)；得分无效时返回 (0.0, None)"""
+        _, max_val, _, max_loc = cv2.minMaxLoc(res)
+        if np.isinf(max_val) or np.isnan(max_val):
+            return 0.0, None
+        return max_val, max_loc
+
+    @staticmethod
+    def _map_score(res):
+        return VisionEngine._map_peak(res)[0]
+
+    def _note_mode(self, key, mode):
+        self.last_match_mode[key] = mode
+        with self._stats_lock:
+            self.change_stats[mode] += 1
+
+    # 模板数达到这个值才拆分给多个线程，每份至少这么多个模板
+    SPLIT_MIN_TEMPLATES = 4
+
+    def _thread_count(self):
+        return max(1, min(int(self.match_threads or 1), os.cpu_count() or 1))
+
+    def _executor(self):
+        """按 match_threads 返回线程池；为 1 时不用线程池"""
+        size = self._thread_count()
+        if size != self._pool_size:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+            self._pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix="match") if size > 1 else None
+            self._pool_size = size
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+        self._pool = None
+        self._pool_size = 0
+
+    def _run_parallel(self, tasks):
+        """
+        在线程池里执行一组无参函数，按提交顺序返回结果
+        当前线程也参与执行：还没被线程池领走的任务由当前线程自己跑，
+        因此在线程池任务内部嵌套调用也不会死锁
+        """
+        pool = self._executor()
+        if pool is None or len(tasks) < 2:
+            return [task() for task in tasks]
+        futures = [pool.submit(task) for task in tasks[1:]]
+        results = [tasks[0]()]
+        for task, future in zip(tasks[1:], futures):
+            results.append(task() if future.cancel() else future.result())
+        return results
+
+    def match_regions(self, jobs):
+        """
+        并行匹配多个区域
+        jobs: {key: (截图, 模板库, 阈值, match_templates 的其余关键字参数)}
+        返回 {key: match_templates 的返回值}（return_max_val=True），顺序与 jobs 一致
+        """
+        keys = list(jobs)
+        tasks = []
+        for key in keys:
+            img, templates, threshold, options = jobs[key]
+            tasks.append(lambda img=img, templates=templates, threshold=threshold, key=key, options=options:
+                         self.match_templates(img, templates, threshold, True, key=key, **options))
+        return dict(zip(keys, self._run_parallel(tasks)))
+
+    def reuse_ratio(self):
+        """变化检测的复用率（复用 + 结果缓存命中 + 局部重算 占全部匹配的比例）"""
+        total = sum(self.change_stats.values())
+        if total == 0:
+            return 0.0
+        return (self.change_stats["reuse"] + self.change_stats["cached"] + self.change_stats["partial"]) / total
+
+    def _hit_order(self, template_list):
+        """模板匹配顺序（按模板库保存），最近命中的模板排在最前；返回副本，遍历时不受其他线程影响"""
+        with self._order_lock:
+            return list(self._order_entry(template_list))
+
+    def _order_entry(self, template_list):
+        entry = self.hit_orders.get(id(template_list))
+        if entry is None or entry[0] is not template_list or len(entry[1]) != len(template_list):
+            entry = (template_list, list(range(len(template_list))))
+            self.hit_orders[id(template_list)] = entry
+        return entry[1]
+
+    def _promote(self, template_list, index):
+        with self._order_lock:
+            order = self._order_entry(template_list)
+            if index in order:
+                order.remove(index)
+                order.insert(0, index)
+
+    def _score_full(self, screen_processed, template_list, stop_at=None, key=None):
+        """
+        全分辨率逐模板匹配，返回 (最高得分, 是否全部跳过, 各模板结果图)
+        stop_at: 给定阈值时按命中顺序匹配，第一个达到阈值的模板即返回
+                 （此时得分只保证 >= 阈值，未匹配的模板结果图为 None）
+        """
+        screen_h, screen_w = screen_processed.shape[:2]
         max_score_found = 0.0
         all_skipped = True 
+        res_maps = [None] * len(template_list)
 
-        for tmpl_processed, mask in template_list:
+        # 完整匹配时大模板库拆成几份并行，结果按模板下标合并，与串行结果完全相同
+        threads = self._thread_count()
+        if stop_at is None and threads > 1 and len(template_list) >= 2 * self.SPLIT_MIN_TEMPLATES:
+            parts = min(threads, len(template_list) // self.SPLIT_MIN_TEMPLATES)
+            chunks = [range(len(template_list))[p::parts] for p in range(parts)]
+            results = self._run_parallel([lambda chunk=chunk: [(i, self._match_checked(screen_processed, template_list[i]))
+                                                               for i in chunk] for chunk in chunks])
+            for i, res in (item for part in results for item in part):
+                if res is not None:
+                    all_skipped = False
+                    if res is not False:
+                        res_maps[i] = res
+            scores = [self._map_score(res) for res in res_maps if res is not None]
+            if key:
+                self.last_evaluated[key] = (len(scores), len(template_list))
+            return max(scores, default=0.0), all_skipped, res_maps
+
+        order = self._hit_order(template_list) if stop_at is not None else range(len(template_list))
+        evaluated = 0
+
+        for i in list(order):
+            tmpl_processed, mask = template_list[i]
             tmpl_h, tmpl_w = tmpl_processed.shape[:2]
             
             if screen_h < tmpl_h or screen_w < tmpl_w:
@@ -144,23 +502,262 @@ class VisionEngine:
 
             try:
                 # === 步骤 2: 匹配 ===
-                # 使用 TM_CCOEFF_NORMED
-                if mask is not None:
-                    res = cv2.matchTemplate(screen_processed, tmpl_processed, cv2.TM_CCOEFF_NORMED, mask=mask)
-                else:
-                    res = cv2.matchTemplate(screen_processed, tmpl_processed, cv2.TM_CCOEFF_NORMED)
-                
-                _, max_val, _, _ = cv2.minMaxLoc(res)
-                
-                if np.isinf(max_val) or np.isnan(max_val):
-                    max_val = 0.0
+                res = self._match_one(screen_processed, tmpl_processed, mask)
+                evaluated += 1
+                res_maps[i] = res
+                max_val = self._map_score(res)
                 
                 if max_val > max_score_found:
                     max_score_found = max_val
 
-            except Exception as e:
+                if stop_at is not None and max_val >= stop_at:
+                    self._promote(template_list, i)
+                    break
+
+            except Exception:
+                continue
+
+        if key:
+            self.last_evaluated[key] = (evaluated, len(template_list))
+        return max_score_found, all_skipped, res_maps
+
+    def _match_checked(self, screen_processed, template):
+        """单个模板匹配：尺寸不符返回 None，匹配出错返回 False"""
+        tmpl_processed, mask = template
+        if screen_processed.shape[0] < tmpl_processed.shape[0] or screen_processed.shape[1] < tmpl_processed.shape[1]:
+            return None
+        try:
+            return self._match_one(screen_processed, tmpl_processed, mask)
+        except Exception:
+            return False
+
+    def _score_dirty(self, screen_processed, template_list, tracker, rects):
+        """局部重算：只更新变化瓦片影响到的结果图位置"""
+        res_maps = tracker.res_maps
+        for (tmpl_processed, mask), res in zip(template_list, res_maps):
+            if res is None:
+                continue
+            tmpl_h, tmpl_w = tmpl_processed.shape[:2]
+            for y0, y1, x0, x1 in rects:
+                ry0, ry1 = max(0, y0 - tmpl_h + 1), min(res.shape[0], y1)
+                rx0, rx1 = max(0, x0 - tmpl_w + 1), min(res.shape[1], x1)
+                if ry0 >= ry1 or rx0 >= rx1:
+                    continue
+                crop = screen_processed[ry0:ry1 + tmpl_h - 1, rx0:rx1 + tmpl_w - 1]
+                try:
+                    res[ry0:ry1, rx0:rx1] = self._match_one(crop, tmpl_processed, mask)
+                except Exception:
+                    continue
+        scores = [self._map_score(res) for res in res_maps if res is not None]
+        return max(scores, default=0.0), tracker.all_skipped, res_maps
+
+    def _score_candidates(self, screen_processed, template_list, candidates, stop_at=None):
+        """颜色预筛选后只在候选框内匹配，返回 (最高得分, 是否全部跳过)"""
+        screen_h, screen_w = screen_processed.shape[:2]
+        max_score_found = 0.0
+        all_skipped = True
+        order = self._hit_order(template_list) if stop_at is not None else range(len(template_list))
+
+        for i in list(order):
+            tmpl_processed, mask = template_list[i]
+            tmpl_h, tmpl_w = tmpl_processed.shape[:2]
+            if screen_h < tmpl_h or screen_w < tmpl_w:
+                continue
+            all_skipped = False
+
+            max_val = 0.0
+            for y0, y1, x0, x1 in candidates:
+                # 贴边的候选框可能比模板小，向内补足到模板尺寸
+                y0 = max(0, min(y0, y1 - tmpl_h))
+                x0 = max(0, min(x0, x1 - tmpl_w))
+                y1 = max(y1, y0 + tmpl_h)
+                x1 = max(x1, x0 + tmpl_w)
+                try:
+                    val = self._map_score(self._match_one(screen_processed[y0:y1, x0:x1], tmpl_processed, mask))
+                except Exception:
+                    continue
+                if val > max_val:
+                    max_val = val
+
+            if max_val > max_score_found:
+                max_score_found = max_val
+
+            if stop_at is not None and max_val >= stop_at:
+                self._promote(template_list, i)
+                break
+
+        return max_score_found, all_skipped
+
+    def match_templates(self, screen_img, template_list, threshold, return_max_val=False, key=None,
+                        mode="standard", early_exit=False, track_roi=False, list_layout=None, color_gate=False,
+                        preprocess=None):
+        """
+        mode: "standard" 全分辨率逐模板匹配
+              "pyramid"  由粗到细金字塔匹配（得分仍为原分辨率得分）
+              "fft"      整库批量 FFT 相关（得分与 standard 在浮点误差内一致）
+              "list"     按行扫描列表（需要 key；list_layout 可给出 pitch / column / row_offset），
+                         同时在 last_row_hits 里给出命中行数；该模式总是完整计算，不提前结束
+        early_exit: 只关心是否达到阈值时使用（standard / pyramid 模式）：
+                    按最近命中顺序匹配，第一个达到阈值的模板即停止，
+                    返回的得分是该模板的得分而不是全库最高分
+        track_roi: 同样只关心阈值时使用（需要 key）：先在该区域上次命中的位置附近复核，
+                   通过就直接返回，否则全量扫描
+        color_gate: 先按模板颜色筛出候选框，没有候选直接判定安全，否则只在候选框内匹配
+                    （得分只覆盖候选框，不适用于列表模式）
+        preprocess: 该区域单独的预处理参数（gamma / cutoff / clahe_clip / clahe_tile），
+                    模板库必须是按同一套参数处理的（见 get_bank）
+        有 key 时，各阶段耗时记录在 stage_ms[key]
+        """
+        if screen_img is None:
+            err = self.last_error if self.last_error else "未获取到截图"
+            return (err, 0.0) if return_max_val else False
+            
+        if not template_list:
+            return ("无模板", 0.0) if return_max_val else False
+
+        if mode == "list":
+            # 列表模式要给出每行结果，不走提前结束、命中追踪和颜色预筛选
+            early_exit = track_roi = color_gate = False
+        
+        # === 步骤 1: 预处理截图 ===
+        # 多区域截图返回的是 BGRA 视图（直接转灰度），单区域截图返回 BGR
+        # 有 key 时写进该区域预分配的缓冲
+        t_start = time.perf_counter()
+        stages = {"gray": 0.0, "preprocess": 0.0, "match": 0.0}
+        if key:
+            self.stage_ms[key] = stages
+        gray_buf = scratch = processed_buf = None
+        if key:
+            tracker = self.trackers.get(key)
+            keep = tracker.processed if tracker else None
+            gray_buf, scratch, processed_buf = self._region_buffers(key, screen_img.shape[:2], keep)
+        if screen_img.ndim == 3 and screen_img.shape[2] == 4:
+            screen_gray = cv2.cvtColor(screen_img, cv2.COLOR_BGRA2GRAY, dst=gray_buf)
+        else:
+            screen_gray = cv2.cvtColor(screen_img, cv2.COLOR_BGR2GRAY, dst=gray_buf)
+        t_gray = time.perf_counter()
+        stages["gray"] = (t_gray - t_start) * 1000
+
+        # === 变化检测：画面没变就直接复用上一次的结果 ===
+        tracker = None
+        fingerprint = None
+        if key and self.change_detection:
+            tracker = self.trackers.get(key)
+            if tracker is None or tracker.mode != mode:
+                tracker = RegionChangeTracker(self.change_tile, mode)
+                self.trackers[key] = tracker
+            fingerprint = tracker.fingerprint_of(screen_gray)
+            if tracker.can_reuse(fingerprint, screen_gray.shape, template_list, threshold):
+                self._note_mode(key, "reuse")
+                return self._finish(tracker.score, tracker.all_skipped, threshold, return_max_val)
+
+        # === 结果缓存：画面和以前某一帧完全相同就取当时的结果 ===
+        params = self.preprocess_params(preprocess)
+        content_key = None
+        if key and mode != "list" and self.result_cache.size > 0:
+            content_key = self.result_cache.key_of(screen_gray, params, mode, bool(color_gate), self.masked_backend)
+            cached = self.result_cache.get(content_key, template_list, threshold)
+            if cached is not None:
+                self._note_mode(key, "cached")
+                if cached[0] < threshold:
+                    self.roi.forget(key)
+                return self._finish(cached[0], cached[1], threshold, return_max_val)
+
+        # === 颜色预筛选：没有颜色像图标的像素就不用做灰度匹配 ===
+        candidates = None
+        if color_gate:
+            candidates = self.color_gate.candidates(screen_img, template_list)
+            if key:
+                self.last_candidates[key] = None if candidates is None else len(candidates)
+            if candidates is not None and not candidates:
+                screen_h, screen_w = screen_gray.shape[:2]
+                all_skipped = all(t.shape[0] > screen_h or t.shape[1] > screen_w for t, _ in template_list)
+                if key:
+                    self._note_mode(key, "gated")
+                    self.roi.forget(key)
+                return self._finish(0.0, all_skipped, threshold, return_max_val)
+        
+        # 使用新的流水线：Gamma -> Threshold -> CLAHE
+        screen_processed = self.preprocess_image(screen_gray, out=processed_buf, scratch=scratch, params=params)
+        t_pre = time.perf_counter()
+        stages["preprocess"] = (t_pre - t_gray) * 1000
+
+        stop_at = threshold if early_exit else None
+
+        # === 命中追踪：先只复核上次命中的位置 ===
+        if track_roi and key:
+            roi_score = self.roi.check(self, key, screen_processed, template_list, threshold)
+            if roi_score is not None:
+                self._note_mode(key, "roi")
+                stages["match"] = (time.perf_counter() - t_pre) * 1000
+                if content_key:
+                    self.result_cache.put(content_key, template_list, roi_score, False, exact=False)
+                if tracker:
+                    tracker.store(fingerprint, screen_processed, template_list, None, roi_score, False, exact=False)
+                return self._finish(roi_score, False, threshold, return_max_val)
+
+        rects = tracker.dirty_rects(screen_processed, template_list) if tracker else None
+
+        if rects is not None:
+            max_score_found, all_skipped, res_maps = self._score_dirty(screen_processed, template_list, tracker, rects)
+            self._note_mode(key, "partial" if rects else "reuse")
+        elif candidates:
+            max_score_found, all_skipped = self._score_candidates(screen_processed, template_list, candidates,
+                                                                  stop_at=stop_at)
+            res_maps = None
+            if key:
+                self._note_mode(key, "gated")
+        else:
+            if mode == "pyramid":
+                max_score_found, all_skipped = self.pyramid.score_bank(screen_processed, template_list, threshold, key,
+                                                                       stop_at=stop_at)
+                res_maps = None
+            elif mode == "fft":
+                max_score_found, all_skipped, res_maps = self.fft.score_bank(screen_processed, template_list)
+            elif mode == "list" and key:
+                max_score_found, all_skipped, row_hits = self.list_scanner.score_bank(
+                    key, screen_processed, template_list, threshold, list_layout)
+                self.last_row_hits[key] = None if row_hits is None else int(np.count_nonzero(row_hits))
+                res_maps = None
+            else:
+                max_score_found, all_skipped, res_maps = self._score_full(screen_processed, template_list,
+                                                                          stop_at=stop_at, key=key)
+            if key:
+                self._note_mode(key, "full")
+
+        stages["match"] = (time.perf_counter() - t_pre) * 1000
+
+        exact = stop_at is None or max_score_found < stop_at
+        if content_key:
+            self.result_cache.put(content_key, template_list, max_score_found, all_skipped, exact=exact)
+        if tracker:
+            # 提前结束时结果图不完整，不能用于局部重算
+            tracker.store(fingerprint, screen_processed, template_list, res_maps if exact else None,
+                          max_score_found, all_skipped, exact=exact)
+
+        if track_roi and key:
+            self._record_roi(key, screen_processed.shape, template_list, res_maps, max_score_found >= threshold)
+
+        return self._finish(max_score_found, all_skipped, threshold, return_max_val)
+
+    def _record_roi(self, key, shape, template_list, res_maps, is_hit):
+        if not is_hit:
+            self.roi.forget(key)
+            return
+        if res_maps is None:
+            # 金字塔模式没有完整结果图，保留原来的追踪状态
+            return
+        best_val, best_loc, best_index = 0.0, None, None
+        for i, res in enumerate(res_maps):
+            if res is None:
                 continue
+            val, loc = self._map_peak(res)
+            if loc is not None and val > best_val:
+                best_val, best_loc, best_index = val, loc, i
+        if best_loc is not None:
+            self.roi.record(key, template_list, best_index, best_loc, shape)
 
+    def _finish(self, max_score_found, all_skipped, threshold, return_max_val):
         if all_skipped:
             return ("尺寸错误", 0.0) if return_max_val else False
 
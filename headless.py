@@ -0,0 +1,119 @@
+"""
+无界面模式：不加载任何 Qt 模块，在命令行里运行监控，把事件写到标准输出或文件。
+适合放在副机上常驻运行；报警通过 Webhook 发出（无界面模式不播放声音）。
+
+用法（在项目根目录）：
+    python headless.py                         # JSON Lines 写到标准输出
+    python headless.py -o events.jsonl         # 追加写入文件
+    python headless.py --format text --alerts-only
+    python headless.py --config other.json --duration 600
+    python headless.py --metrics-port 9108     # 分阶段耗时统计：http://127.0.0.1:9108/metrics
+    python headless.py --source synthetic      # 不需要游戏：合成画面
+    python headless.py --source recordings/s1  # 回放录好的画面（文件夹 / zip / npz），shm:名称 为共享内存，.everec 为会话录像
+"""
+import argparse
+import json
+import multiprocessing
+import signal
+import sys
+import threading
+
+from core.config_manager import ConfigManager, CONFIG_FILE
+from core.vision import VisionEngine
+from core.audio_logic import AlarmWorker
+from core.frame_source import make_source
+from core.regions import load_regions, has_threat_region
+
+
+class EventWriter:
+    """把监控线程发出的事件按行写出（JSON Lines 或原来的日志文本），每行立即刷新"""
+
+    def __init__(self, stream, fmt="json", alerts_only=False):
+        self.stream = stream
+        self.fmt = fmt
+        self.alerts_only = alerts_only
+        self._lock = threading.Lock()
+
+    def _write(self, line):
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+    def on_event(self, event):
+        if self.fmt != "json" or (self.alerts_only and event["event"] == "safe"):
+            return
+        self._write(json.dumps(event, ensure_ascii=False))
+
+    def on_log(self, text):
+        if self.fmt != "text" or (self.alerts_only and "✅" in text):
+            return
+        self._write(text)
+
+
+def source_spec(value, cfg):
+    """--source 参数 -> 画面来源配置；不给时用配置文件里的 frame_source"""
+    if not value:
+        return cfg.get("frame_source")
+    if value in ("mss", "synthetic"):
+        return dict(cfg.get("frame_source") or {}, type=value)
+    if value.startswith("shm:"):
+        return {"type": "shm", "name": value[4:]}
+    if value.endswith(".everec"):
+        return {"type": "recording", "path": value}
+    return {"type": "directory", "path": value}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="EVE Visual Alert 无界面模式")
+    parser.add_argument("-c", "--config", default=CONFIG_FILE, help="配置文件（默认 config.json）")
+    parser.add_argument("-o", "--output", default="-", help="事件输出文件，- 表示标准输出（默认）")
+    parser.add_argument("--format", choices=("json", "text"), default="json",
+                        help="json：每行一个 JSON 事件；text：与界面相同的日志行")
+    parser.add_argument("--alerts-only", action="store_true", help="不输出安全状态，只输出报警和系统事件")
+    parser.add_argument("--source", help="画面来源：mss / synthetic / shm:名称 / 会话录像 .everec / 画面文件夹或压缩包路径")
+    parser.add_argument("--metrics-port", type=int, help="打开分阶段耗时统计，并在本机这个端口提供 /metrics")
+    parser.add_argument("--metrics-file", help="打开分阶段耗时统计，并定期写到这个 JSON 文件")
+    parser.add_argument("--duration", type=float, default=0, help="运行多少秒后退出（0 表示一直运行）")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    cfg = ConfigManager(args.config)
+    # 命令行参数只在本次运行生效，不写回配置文件
+    if args.metrics_port is not None or args.metrics_file:
+        cfg.config["metrics_enabled"] = True
+        if args.metrics_port is not None:
+            cfg.config["metrics_port"] = args.metrics_port
+        if args.metrics_file:
+            cfg.config["metrics_file"] = args.metrics_file
+    if not has_threat_region(load_regions(cfg)):
+        print("未设置本地或总览区域，请先在界面里框选区域", file=sys.stderr)
+        return 2
+
+    stream = sys.stdout if args.output == "-" else open(args.output, "a", encoding="utf-8")
+    writer = EventWriter(stream, args.format, args.alerts_only)
+    worker = AlarmWorker(cfg, VisionEngine(), make_source(source_spec(args.source, cfg)))
+    worker.event_signal.connect(writer.on_event)
+    worker.log_signal.connect(writer.on_log)
+
+    stop = threading.Event()
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+    worker.start()
+    try:
+        stop.wait(args.duration or None)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.stop()
+        if stream is not sys.stdout:
+            stream.close()
+    return 0
+
+
+if __name__ == "__main__":
+    # 多进程匹配后端在打包后的程序里也能启动子进程
+    multiprocessing.freeze_support()
+    sys.exit(main())
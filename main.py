@@ -1,20 +1,23 @@
 import sys
 import os
 import ctypes
+import multiprocessing
 from ctypes import wintypes
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QPushButton, QLabel, QFileDialog, 
                              QGroupBox, QDoubleSpinBox, QLineEdit, QTextEdit, QDialog, QFrame, QSizePolicy)
-from PyQt6.QtCore import QTimer, Qt
+from PyQt6.QtCore import QTimer, Qt, QObject, pyqtSignal
 from PyQt6.QtGui import QPixmap, QImage, QFont, QIcon
 from PyQt6.QtMultimedia import QSoundEffect
 from PyQt6.QtCore import QUrl
 
 from core.config_manager import ConfigManager
 from core.vision import VisionEngine
+from core.frame_source import make_source
 from ui.selector import RegionSelector
 from core.audio_logic import AlarmWorker
 from core.i18n import Translator
+from core.regions import load_regions, has_threat_region, BUILTIN_ORDER
 
 # =============================================================================
 # === 增强版 Hi-DPI 修复 ===
@@ -119,41 +122,48 @@ QScrollBar::handle:vertical {
 """
 
 class DebugWindow(QDialog):
+    # 内置区域的显示标题
+    TITLES = {"local": "Local", "overview": "Overview", "monster": "Npc"}
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("LIVE VIEW")
         self.setStyleSheet("background-color: #000; color: #00bcd4;")
         
-        # 使用横向布局，把三个长条并排显示
-        layout = QHBoxLayout()
-        layout.setContentsMargins(5,5,5,5)
-        layout.setSpacing(10) # 增加一点间距
+        # 使用横向布局，把各区域的长条并排显示
+        self.columns = QHBoxLayout()
+        self.columns.setContentsMargins(5,5,5,5)
+        self.columns.setSpacing(10) # 增加一点间距
         
         self.labels = {}
-        for key in ["Local", "Overview", "Npc"]:
-            vbox = QVBoxLayout()
-            
-            lbl_title = QLabel(key.upper())
-            lbl_title.setAlignment(Qt.AlignmentFlag.AlignCenter)
-            lbl_title.setFixedHeight(20) # 标题占少一点高度
-            
-            lbl_img = QLabel()
-            # 修改点：设置为窄长模式
-            # 宽度固定 120，高度最大 600
-            lbl_img.setFixedSize(120, 600)
-            lbl_img.setStyleSheet("border: 1px solid #333; background: #111;")
-            lbl_img.setAlignment(Qt.AlignmentFlag.AlignTop | Qt.AlignmentFlag.AlignHCenter) # 图片顶对齐
+        for key in ["local", "overview", "monster"]:
+            self._add_column(key)
             
-            vbox.addWidget(lbl_title)
-            vbox.addWidget(lbl_img)
-            layout.addLayout(vbox)
-            self.labels[key] = lbl_img
-            
-        self.setLayout(layout)
+        self.setLayout(self.columns)
         # 调整窗口初始大小
         self.resize(400, 650)
 
-    def update_images(self, img_local, img_overview, img_monster):
+    def _add_column(self, key):
+        vbox = QVBoxLayout()
+        
+        lbl_title = QLabel(self.TITLES.get(key, key).upper())
+        lbl_title.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        lbl_title.setFixedHeight(20) # 标题占少一点高度
+        
+        lbl_img = QLabel()
+        # 修改点：设置为窄长模式
+        # 宽度固定 120，高度最大 600
+        lbl_img.setFixedSize(120, 600)
+        lbl_img.setStyleSheet("border: 1px solid #333; background: #111;")
+        lbl_img.setAlignment(Qt.AlignmentFlag.AlignTop | Qt.AlignmentFlag.AlignHCenter) # 图片顶对齐
+        
+        vbox.addWidget(lbl_title)
+        vbox.addWidget(lbl_img)
+        self.columns.addLayout(vbox)
+        self.labels[key] = lbl_img
+
+    def update_images(self, images):
+        """images: {区域 key: BGR 图像}，额外区域第一次出现时添加一列"""
         def np2pixmap(np_img):
             if np_img is None: return QPixmap()
             h, w, ch = np_img.shape
@@ -162,17 +172,25 @@ class DebugWindow(QDialog):
             # 缩放时保持比例，宽度限制在120以内，高度随比例自动调整
             return QPixmap.fromImage(qimg).scaled(120, 600, Qt.AspectRatioMode.KeepAspectRatio)
 
-        self.labels["Local"].setPixmap(np2pixmap(img_local))
-        self.labels["Overview"].setPixmap(np2pixmap(img_overview))
-        self.labels["Npc"].setPixmap(np2pixmap(img_monster))
+        for key, img in images.items():
+            if key not in self.labels:
+                self._add_column(key)
+            self.labels[key].setPixmap(np2pixmap(img))
+
+class WorkerBridge(QObject):
+    """把监控线程里发出的日志转发到界面线程（AlarmWorker 本身不依赖 Qt）"""
+    log_signal = pyqtSignal(str)
 
 class MainWindow(QMainWindow):
+    # 区域按钮和阈值每行最多几个
+    REGION_COLUMNS = 3
+
     def __init__(self):
         super().__init__()
         
         self.cfg = ConfigManager()
         self.vision = VisionEngine()
-        self.logic = AlarmWorker(self.cfg, self.vision)
+        self.logic = AlarmWorker(self.cfg, self.vision, make_source(self.cfg.get("frame_source")))
         self.i18n = Translator(None) 
         
         self.init_core()
@@ -191,20 +209,27 @@ class MainWindow(QMainWindow):
     def init_core(self):
         self.sounds = {} 
         self.load_sounds()
-        self.logic.log_signal.connect(self.log)
-        self.logic.log_signal.connect(self.handle_alarm_signal)
+        self.bridge = WorkerBridge()
+        self.logic.log_signal.connect(self.bridge.log_signal.emit)
+        self.bridge.log_signal.connect(self.log)
+        self.bridge.log_signal.connect(self.handle_alarm_signal)
         self.debug_timer = QTimer()
         self.debug_timer.timeout.connect(self.update_debug_view)
         QTimer.singleShot(1000, self.check_auto_start)
 
     def check_auto_start(self):
-        regions = self.cfg.get("regions")
-        if regions.get("local") is not None or regions.get("overview") is not None:
+        if self.has_threat_region():
             self.log("Auto-Sequence Initiated...")
             self.toggle_monitoring()
 
+    def has_threat_region(self):
+        return has_threat_region(load_regions(self.cfg))
+
     def load_sounds(self):
-        for key in ["local", "overview", "monster", "mixed"]:
+        # 内置四个音效，以及额外区域在 audio_paths 里自定义的音效
+        keys = ["local", "overview", "monster", "mixed"]
+        keys += [k for k in (self.cfg.get("audio_paths") or {}) if k not in keys]
+        for key in keys:
             path = self.cfg.get_audio_path(key)
             if path and os.path.exists(path):
                 effect = QSoundEffect()
@@ -238,21 +263,28 @@ class MainWindow(QMainWindow):
         main_layout.addLayout(top_layout)
 
         # === 区域设置 ===
+        # 按 load_regions 生成：内置三个区域，再加上 extra_regions 里的额外区域（没设截图范围的也列出来，
+        # 这样才能在界面上框选）；每行最多 REGION_COLUMNS 个。新增额外区域后需要重启程序
+        regions = load_regions(self.cfg, require_rect=False)
         self.grp_monitor = QGroupBox("Sectors")
-        layout_mon = QHBoxLayout()
+        layout_mon = QVBoxLayout()
         layout_mon.setSpacing(5)
-        
-        self.btn_set_local = QPushButton("Local")
-        self.btn_set_overview = QPushButton("Overview")
-        self.btn_set_npc = QPushButton("Rats")
-        
-        for btn, key in [(self.btn_set_local, "local"), 
-                         (self.btn_set_overview, "overview"), 
-                         (self.btn_set_npc, "monster")]:
+
+        self.region_buttons = {}
+        for i, region in enumerate(regions):
+            if i % self.REGION_COLUMNS == 0:
+                row_mon = QHBoxLayout()
+                row_mon.setSpacing(5)
+                layout_mon.addLayout(row_mon)
+            btn = QPushButton(region.key)
             btn.setFixedHeight(28)
-            btn.clicked.connect(lambda _, k=key: self.start_region_selection(k))
-            layout_mon.addWidget(btn)
-            
+            btn.clicked.connect(lambda _, k=region.key: self.start_region_selection(k))
+            row_mon.addWidget(btn)
+            self.region_buttons[region.key] = btn
+        self.btn_set_local = self.region_buttons["local"]
+        self.btn_set_overview = self.region_buttons["overview"]
+        self.btn_set_npc = self.region_buttons["monster"]
+
         self.grp_monitor.setLayout(layout_mon)
         main_layout.addWidget(self.grp_monitor)
 
@@ -261,43 +293,28 @@ class MainWindow(QMainWindow):
         layout_cfg = QVBoxLayout()
         layout_cfg.setSpacing(6)
 
-        # 阈值设置
-        row_thresh = QHBoxLayout()
-        
-        vbox1 = QVBoxLayout()
-        self.lbl_th_local = QLabel("Local %")
-        self.spin_local = QDoubleSpinBox()
-        self.spin_local.setRange(0.1, 1.0)
-        self.spin_local.setSingleStep(0.01)
-        self.spin_local.setValue(self.cfg.get("thresholds").get("local", 0.95))
-        self.spin_local.valueChanged.connect(lambda v: self.update_cfg("thresholds", "local", v))
-        vbox1.addWidget(self.lbl_th_local)
-        vbox1.addWidget(self.spin_local)
-        
-        vbox2 = QVBoxLayout()
-        self.lbl_th_over = QLabel("Over %")
-        self.spin_over = QDoubleSpinBox()
-        self.spin_over.setRange(0.1, 1.0)
-        self.spin_over.setSingleStep(0.01)
-        self.spin_over.setValue(self.cfg.get("thresholds").get("overview", 0.95))
-        self.spin_over.valueChanged.connect(lambda v: self.update_cfg("thresholds", "overview", v))
-        vbox2.addWidget(self.lbl_th_over)
-        vbox2.addWidget(self.spin_over)
-        
-        vbox3 = QVBoxLayout()
-        self.lbl_th_npc = QLabel("Rats %")
-        self.spin_npc = QDoubleSpinBox()
-        self.spin_npc.setRange(0.1, 1.0)
-        self.spin_npc.setSingleStep(0.01)
-        self.spin_npc.setValue(self.cfg.get("thresholds").get("monster", 0.95))
-        self.spin_npc.valueChanged.connect(lambda v: self.update_cfg("thresholds", "monster", v))
-        vbox3.addWidget(self.lbl_th_npc)
-        vbox3.addWidget(self.spin_npc)
-        
-        row_thresh.addLayout(vbox1)
-        row_thresh.addLayout(vbox2)
-        row_thresh.addLayout(vbox3)
-        layout_cfg.addLayout(row_thresh)
+        # 阈值设置：每个区域一个，与区域按钮顺序相同
+        self.threshold_labels = {}
+        self.threshold_spins = {}
+        for i, region in enumerate(regions):
+            if i % self.REGION_COLUMNS == 0:
+                row_thresh = QHBoxLayout()
+                layout_cfg.addLayout(row_thresh)
+            vbox = QVBoxLayout()
+            lbl = QLabel(f"{region.key} %")
+            spin = QDoubleSpinBox()
+            spin.setRange(0.1, 1.0)
+            spin.setSingleStep(0.01)
+            spin.setValue(region.threshold)
+            spin.valueChanged.connect(lambda v, k=region.key: self.update_threshold(k, v))
+            vbox.addWidget(lbl)
+            vbox.addWidget(spin)
+            row_thresh.addLayout(vbox)
+            self.threshold_labels[region.key] = lbl
+            self.threshold_spins[region.key] = spin
+        self.lbl_th_local, self.spin_local = self.threshold_labels["local"], self.threshold_spins["local"]
+        self.lbl_th_over, self.spin_over = self.threshold_labels["overview"], self.threshold_spins["overview"]
+        self.lbl_th_npc, self.spin_npc = self.threshold_labels["monster"], self.threshold_spins["monster"]
         
         # Webhook
         row2 = QHBoxLayout()
@@ -308,8 +325,12 @@ class MainWindow(QMainWindow):
         row2.addWidget(self.line_webhook)
         layout_cfg.addLayout(row2)
 
-        # 音频列表
-        for key in ["local", "overview", "monster", "mixed"]:
+        # 音频列表：内置四个音效，以及额外区域用到的、audio_paths 里自定义的音效
+        sound_keys = ["local", "overview", "monster", "mixed"]
+        for key in [r.sound for r in regions] + list(self.cfg.get("audio_paths") or {}):
+            if key not in sound_keys:
+                sound_keys.append(key)
+        for key in sound_keys:
             row = QHBoxLayout()
             lbl = QLabel(f"{key}:")
             setattr(self, f"lbl_sound_{key}", lbl) 
@@ -400,9 +421,12 @@ class MainWindow(QMainWindow):
         self.selector.show()
 
     def save_region(self, key, rect):
-        regions = self.cfg.get("regions")
-        regions[key] = list(rect)
-        self.cfg.set("regions", regions)
+        if key in BUILTIN_ORDER:
+            regions = self.cfg.get("regions")
+            regions[key] = list(rect)
+            self.cfg.set("regions", regions)
+        else:
+            self.update_extra_region(key, "rect", list(rect))
         self.log(f"{self.i18n.get('region_updated')}: {key.upper()}")
 
     def update_cfg(self, section, key, val):
@@ -410,6 +434,21 @@ class MainWindow(QMainWindow):
         t[key] = val
         self.cfg.set(section, t)
 
+    def update_threshold(self, key, val):
+        """内置区域的阈值在 thresholds 里，额外区域的阈值写在 extra_regions 自己那一项里"""
+        if key in BUILTIN_ORDER:
+            self.update_cfg("thresholds", key, val)
+        else:
+            self.update_extra_region(key, "threshold", val)
+
+    def update_extra_region(self, key, field, val):
+        entries = self.cfg.get("extra_regions") or []
+        for entry in entries:
+            if isinstance(entry, dict) and str(entry.get("key")) == key:
+                entry[field] = val
+                self.cfg.set("extra_regions", entries)
+                return
+
     def select_audio(self, key, label_widget):
         fname, _ = QFileDialog.getOpenFileName(self, "Audio File", "", "Audio (*.wav *.mp3)")
         if fname:
@@ -433,8 +472,7 @@ class MainWindow(QMainWindow):
     def toggle_monitoring(self):
         _ = self.i18n.get
         if not self.logic.running:
-            regions = self.cfg.get("regions")
-            if not regions.get("local") and not regions.get("overview"):
+            if not self.has_threat_region():
                 self.log(_("log_region_err"))
                 return
 
@@ -450,13 +488,12 @@ class MainWindow(QMainWindow):
 
     def handle_alarm_signal(self, msg):
         if "⚠️" in msg:
-            for keyword in ["mixed", "overview", "local", "monster"]:
-                if keyword.upper() in msg.upper():
-                    if keyword in self.sounds:
-                        effect = self.sounds[keyword]
-                        if not effect.isPlaying():
-                            effect.play()
-                    break
+            # 日志格式：⚠️ 触发: <音效名> [...]
+            keyword = msg.split("触发:", 1)[-1].split()[0].lower() if "触发:" in msg else ""
+            if keyword in self.sounds:
+                effect = self.sounds[keyword]
+                if not effect.isPlaying():
+                    effect.play()
 
     def show_debug_window(self):
         self.debug_window.show()
@@ -466,11 +503,8 @@ class MainWindow(QMainWindow):
         if not self.debug_window.isVisible():
             self.debug_timer.stop()
             return
-        regions = self.cfg.get("regions")
-        img_local = self.vision.capture_screen(regions.get("local"))
-        img_overview = self.vision.capture_screen(regions.get("overview"))
-        img_monster = self.vision.capture_screen(regions.get("monster"))
-        self.debug_window.update_images(img_local, img_overview, img_monster)
+        images = {r.key: self.vision.capture_screen(r.rect) for r in load_regions(self.cfg)}
+        self.debug_window.update_images(images)
 
     def log(self, text):
         self.txt_log.append(text)
@@ -478,6 +512,8 @@ class MainWindow(QMainWindow):
         sb.setValue(sb.maximum())
 
 if __name__ == "__main__":
+    # 多进程匹配后端在打包后的程序里也能启动子进程
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     win = MainWindow()
     win.show()
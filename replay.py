@@ -0,0 +1,141 @@
+"""
+会话录像回放：用当前的 VisionEngine 和配置重新匹配录像里的每一帧（不按录制时的节奏，尽快跑完），
+和录制时的得分、报警对比，找出误报 / 漏报在新代码或新阈值下是否还会发生。
+
+用法（在项目根目录）：
+    python replay.py recordings/20260101_200000.everec
+    python replay.py recordings/xxx.everec --config tuned.json -o diff.jsonl
+    python replay.py recordings/xxx.everec --dump-dir frames/   # 把报警判定有变化的帧导出成图片
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import cv2
+
+from core.config_manager import ConfigManager, CONFIG_FILE
+from core.vision import VisionEngine
+from core.audio_logic import apply_vision_settings, match_options
+from core.recorder import read_recording
+from core.regions import load_regions, region_from_entry, choose_sound
+
+
+def session_regions(session, cfg, vision):
+    """
+    录像里的区域（key / 截图范围 / 模板库 / 阈值 / 客户端）。当前配置里有同名区域时，
+    阈值、优先级、音效和匹配参数按当前配置；配置里没有的区域按录像里的阈值和模板库的默认值。
+    录像没有区域信息或模板库找不到时抛出 ValueError，不能当作没有报警
+    """
+    recorded = session.get("regions")
+    if not recorded:
+        raise ValueError("录像里没有区域信息，无法回放")
+    configured = {r.key: r for r in load_regions(cfg, require_rect=False)}
+    thresholds = cfg.get("thresholds") or {}
+    regions = []
+    for entry in recorded:
+        region = region_from_entry(entry)
+        if region is None:
+            raise ValueError(f"录像里的区域无法识别: {entry!r}")
+        if region.bank not in vision.bank_folders and not os.path.isdir(os.path.join(os.getcwd(), region.bank)):
+            raise ValueError(f"区域 {region.key} 的模板库 {region.bank} 不存在")
+        current = configured.get(region.key)
+        if current is not None:
+            current.rect, current.bank = region.rect, region.bank
+            region = current
+        elif region.key in thresholds:
+            region.threshold = thresholds[region.key]
+        regions.append(region)
+    return regions
+
+
+def replay(path, cfg, vision, on_frame=None):
+    """
+    重新匹配录像，返回统计；on_frame(录像帧, 新结果, 新报警) 每帧调用一次。
+    区域取自录像（见 session_regions），当前配置只覆盖阈值和匹配参数。
+    """
+    session, frames = read_recording(path)
+    vision.load_templates()
+    apply_vision_settings(cfg, vision)
+    regions = session_regions(session, cfg, vision)
+    keys = {r.key for r in regions}
+    options = {r.key: match_options(cfg, r) for r in regions}
+
+    stats = {"frames": 0, "alerts_then": 0, "alerts_now": 0, "changed": 0, "match_s": 0.0}
+    latest = {}
+    started = time.perf_counter()
+    first_ts = last_ts = None
+    for frame in frames:
+        first_ts = frame.timestamp if first_ts is None else first_ts
+        last_ts = frame.timestamp
+        unknown = set(frame.images) - keys
+        if unknown:
+            raise ValueError(f"第 {frame.seq} 帧的区域 {', '.join(sorted(unknown))} 不在录像的区域列表里")
+        active = [r for r in regions if r.key in frame.images]
+        t0 = time.perf_counter()
+        results = vision.match_regions(
+            {r.key: (frame.images[r.key], vision.get_bank(r.bank, options[r.key]["preprocess"]), r.threshold, options[r.key])
+             for r in active})
+        stats["match_s"] += time.perf_counter() - t0
+        latest.update(results)
+
+        sound = choose_sound([r for r in regions if r.key in latest and latest[r.key][1] >= r.threshold])
+        stats["frames"] += 1
+        stats["alerts_then"] += frame.sound is not None
+        stats["alerts_now"] += sound is not None
+        stats["changed"] += sound != frame.sound
+        if on_frame:
+            on_frame(frame, results, sound)
+
+    stats["wall_s"] = time.perf_counter() - started
+    stats["recorded_s"] = (last_ts - first_ts) if first_ts is not None else 0.0
+    stats["session"] = session
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="会话录像回放")
+    parser.add_argument("recording", help="录像文件（.everec）")
+    parser.add_argument("-c", "--config", default=CONFIG_FILE, help="用这份配置的阈值和匹配参数（默认 config.json）")
+    parser.add_argument("-o", "--output", help="把每一帧的新旧得分写成 JSON Lines")
+    parser.add_argument("--dump-dir", help="把报警判定有变化的帧的区域画面导出到这个文件夹")
+    args = parser.parse_args(argv)
+
+    cfg = ConfigManager(args.config)
+    out = open(args.output, "w", encoding="utf-8") if args.output else None
+    if args.dump_dir:
+        os.makedirs(args.dump_dir, exist_ok=True)
+
+    def on_frame(frame, results, sound):
+        if out:
+            out.write(json.dumps({
+                "seq": frame.seq, "time": frame.timestamp, "sound_then": frame.sound, "sound_now": sound,
+                "then": {k: v[1] for k, v in frame.results.items()},
+                "now": {k: round(float(v[1]), 4) for k, v in results.items()},
+            }, ensure_ascii=False) + "\n")
+        if sound != frame.sound:
+            print(f"#{frame.seq} {time.strftime('%H:%M:%S', time.localtime(frame.timestamp))} "
+                  f"录制时 {frame.sound or '安全'} -> 现在 {sound or '安全'} "
+                  + " ".join(f"{k}:{frame.results.get(k, [None, 0])[1]:.2f}->{v[1]:.2f}" for k, v in results.items()))
+            if args.dump_dir:
+                for key, img in frame.images.items():
+                    cv2.imwrite(os.path.join(args.dump_dir, f"{frame.seq:06d}_{key}.png"), img)
+
+    try:
+        stats = replay(args.recording, cfg, VisionEngine(), on_frame)
+    except ValueError as e:
+        print(f"回放失败: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if out:
+            out.close()
+
+    speed = stats["recorded_s"] / stats["wall_s"] if stats["wall_s"] else 0.0
+    print(f"回放 {stats['frames']} 帧，用时 {stats['wall_s']:.1f}s（录制时长 {stats['recorded_s']:.0f}s，{speed:.0f} 倍速，"
+          f"匹配 {stats['match_s']:.1f}s）")
+    print(f"报警帧：录制时 {stats['alerts_then']}，现在 {stats['alerts_now']}，判定不同 {stats['changed']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())